@@ -1,12 +1,2442 @@
+import time
+
+STARTED = time.perf_counter()  # startup timings are measured from here
+
 import tkinter as tk
 from tkinter import ttk, messagebox
-import requests
 import threading
 from datetime import datetime
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from hashlib import sha1
+import argparse
+import gc
+import heapq
+import importlib
+import importlib.util
+import json
+import logging
 import math
+import os
+import random
+import re
+import sqlite3
+import sys
+import unicodedata
+from typing import NamedTuple
+from urllib.parse import parse_qs, quote, unquote
+
+# Optional faster JSON decoder
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+log = logging.getLogger("weatherme")
+
+
+class LazyModule:
+    """Stand-in for a module that is only imported on first attribute access"""
+    
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+    
+    def load(self):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return self._module
+    
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+
+# requests takes ~100 ms to import, so the app loads it in the background after the first frame
+requests = LazyModule("requests")
+
+# Optional: numpy speeds up history queries; it is only imported when one runs
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+np = LazyModule("numpy")
+
+# Response cache settings
+DATA_DIR = os.path.join(os.path.expanduser("~"), ".weatherme")
+CACHE_PATH = os.path.join(DATA_DIR, "cache.sqlite3")
+CACHE_TTL = 10 * 60  # seconds before a cached response is considered stale
+CACHE_MAX_ENTRIES = 64
+CACHE_MAX_BYTES = 2 * 1024 * 1024
+
+# HTTP transport settings
+BASE_URL = os.environ.get("WEATHERME_BASE_URL", "https://wttr.in/")
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 10
+
+# Upstream resilience: retries, hedged requests and the circuit breaker
+FETCH_RETRIES = 2
+FETCH_BACKOFF = 0.25  # seconds before the first retry, doubled per attempt, with full jitter
+FETCH_MAX_BACKOFF = 4
+HEDGE_REQUESTS = True  # send a second copy of a request that is slower than the recent p95
+HEDGE_MIN_SAMPLES = 20  # request timings needed before hedging starts
+HEDGE_WINDOW = 100
+HEDGE_MIN_DELAY = 0.25
+BREAKER_THRESHOLD = 5  # consecutive upstream failures that open the circuit
+BREAKER_RESET_SECONDS = 30
+
+# "full" fetches the whole j1 payload up front. "tiered" first fetches a small
+# current-conditions line and loads the forecast in the background; "lazy" only
+# loads the forecast once the user scrolls to it.
+FETCH_MODE = "tiered"
+LITE_FORMAT = "%l|%t|%f|%C|%w|%h|%P|%p"
+
+# Request scheduling
+FETCH_WORKERS = 2
+DEBOUNCE_SECONDS = 0.3  # repeat submits of the same city inside this window are ignored
+
+# Animation settings
+ANIMATION_FPS = 20
+IDLE_PAUSE_SECONDS = 120  # decorative animations stop after this long without user input
+CIRCLE_STEPS = 720  # background circles advance 0.5 degrees per step
+CIRCLE_STEP_SECONDS = 0.05
+
+# Favorites and background refresh
+FAVORITES_PATH = os.path.join(DATA_DIR, "favorites.json")
+MAX_FAVORITES = 6
+REFRESH_INTERVAL = 15 * 60  # default per-city refresh interval in seconds
+REFRESH_JITTER = 0.1  # fraction of the interval added at random to spread refreshes out
+REFRESH_TICK_MS = 5000
+REFRESH_CONCURRENCY = 1
+REFRESH_BACKOFF = 30  # first backoff after an upstream failure, doubled per failure
+REFRESH_MAX_BACKOFF = 30 * 60
+
+# Last viewed city, restored on the first frame at startup
+STATE_PATH = os.path.join(DATA_DIR, "state.json")
+
+# Observation history: one sample per city every HISTORY_INTERVAL seconds, kept for trends
+HISTORY_DIR = os.path.join(DATA_DIR, "history")
+HISTORY_INTERVAL = 10 * 60
+HISTORY_RETENTION_DAYS = 400
+HISTORY_TREND_DAYS = 90
+HISTORY_MAX_OPEN = 16  # cities whose day index is kept in memory
+# Stored columns: (name, array typecode, value stored for "missing", scale factor)
+HISTORY_COLUMNS = (
+    ("time", "I", None, 1),
+    ("temp_c", "h", -32768, 1),
+    ("feels_like_c", "h", -32768, 1),
+    ("humidity", "B", 255, 1),
+    ("pressure", "H", 65535, 1),
+    ("wind_kmph", "H", 65535, 1),
+    ("cloudcover", "B", 255, 1),
+    ("precip_mm", "H", 65535, 10),
+)
+
+# Kiosk mode (--kiosk): rotate through cities unattended for weeks, within fixed resource caps
+KIOSK_INTERVAL = 60  # seconds each city stays on screen
+KIOSK_MAX_THREADS = 16
+KIOSK_MAX_CACHE_BYTES = 1024 * 1024
+KIOSK_MAX_WIDGETS = 300
+KIOSK_MAX_TK_COMMANDS = 2000  # Tcl commands, one per live Python callback
+KIOSK_REPORT_SECONDS = 15 * 60
+
+# Headless batch mode (--batch)
+BATCH_WORKERS = 8
+BATCH_RATE = 5.0  # requests per second across all workers; 0 for no limit
+BATCH_PROGRESS_SECONDS = 10
+BATCH_LATENCY_SAMPLES = 1024  # latency reservoir size for the percentiles in the summary
+
+# Shared caching proxy (--serve)
+PROXY_HOST = "127.0.0.1"
+PROXY_PORT = 8765
+PROXY_WORKERS = 8  # concurrent upstream fetches
+PROXY_CACHE_PATH = os.path.join(DATA_DIR, "proxy-cache.sqlite3")
+PROXY_MAX_ENTRIES = 1024
+PROXY_MAX_BYTES = 64 * 1024 * 1024
+
+# Hourly forecast chart
+HOURLY_DAYS = 3  # days of three-hourly points kept from the j1 payload
+HOURLY_COLUMN_WIDTH = 56
+HOURLY_CHART_HEIGHT = 204
+
+# Weather icons: sprite sheets drawn by icons/make_icons.py, one per size, decoded once each
+ICON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "icons")
+ICON_SIZE_CURRENT = 96
+ICON_SIZE_FORECAST = 48
+ICON_SIZE_HOURLY = 24
+ICON_SIZES = (ICON_SIZE_CURRENT, ICON_SIZE_FORECAST, ICON_SIZE_HOURLY)
+# Sheet order, left to right
+ICON_NAMES = (
+    "clear-day", "clear-night", "partly-cloudy-day", "partly-cloudy-night", "cloudy",
+    "fog", "drizzle", "rain", "sleet", "snow", "thunder",
+)
+# Shown instead when the sheets can't be loaded (e.g. Tk older than 8.6 can't read PNG)
+ICON_EMOJI = {
+    "clear-day": "☀️", "clear-night": "🌙", "partly-cloudy-day": "⛅", "partly-cloudy-night": "☁️",
+    "cloudy": "☁️", "fog": "🌫️", "drizzle": "🌦️", "rain": "🌧️", "sleet": "🌨️", "snow": "❄️",
+    "thunder": "⛈️",
+}
+# wttr.in weatherCode -> icon; "clear" and "partly-cloudy" get a -day or -night suffix
+WEATHER_CODE_ICONS = {
+    113: "clear", 116: "partly-cloudy", 119: "cloudy", 122: "cloudy",
+    143: "fog", 248: "fog", 260: "fog",
+    263: "drizzle", 266: "drizzle",
+    176: "rain", 293: "rain", 296: "rain", 299: "rain", 302: "rain", 305: "rain", 308: "rain",
+    353: "rain", 356: "rain", 359: "rain",
+    182: "sleet", 185: "sleet", 281: "sleet", 284: "sleet", 311: "sleet", 314: "sleet", 317: "sleet",
+    320: "sleet", 350: "sleet", 362: "sleet", 365: "sleet", 374: "sleet", 377: "sleet",
+    179: "snow", 227: "snow", 230: "snow", 323: "snow", 326: "snow", 329: "snow", 332: "snow",
+    335: "snow", 338: "snow", 368: "snow", 371: "snow",
+    200: "thunder", 386: "thunder", 389: "thunder", 392: "thunder", 395: "thunder",
+}
+# For answers without a weatherCode (the lite format): first matching words win
+DESCRIPTION_ICONS = (
+    (("thunder", "storm"), "thunder"),
+    (("sleet", "freezing", "ice"), "sleet"),
+    (("snow", "blizzard"), "snow"),
+    (("drizzle",), "drizzle"),
+    (("rain", "shower"), "rain"),
+    (("fog", "mist", "haze"), "fog"),
+    (("partly",), "partly-cloudy"),
+    (("cloud", "overcast"), "cloudy"),
+    (("clear", "sunny"), "clear"),
+)
+
+# City autocomplete
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "gazetteer.tsv")
+SUGGESTION_LIMIT = 6
+SUGGEST_DEBOUNCE_MS = 120
+
+# Tracing (toggle the overlay with F12)
+TRACE_CAPACITY = 500  # spans kept in memory
+LAG_SAMPLE_MS = 250  # main-loop lag sampling interval while tracing
+LAG_SPAN_MS = 20  # lag above this is also recorded as a span
+
+
+def normalize_city(city):
+    """Normalize a city name so that 'london', ' London ' and 'LONDON' share a cache key"""
+    return " ".join(city.strip().lower().split())
+
+
+def fold_name(text):
+    """Normalize a place name for matching: lowercase, single spaces and no accents ('São Paulo' -> 'sao paulo')"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return normalize_city("".join(ch for ch in decomposed if not unicodedata.combining(ch)))
+
+
+def cache_key(city, lite=False):
+    """Cache key for a city; lite (current conditions only) answers are kept apart from full ones"""
+    key = normalize_city(city)
+    return key + "?lite" if lite else key
+
+
+def format_age(seconds):
+    if seconds < 60:
+        return "just now"
+    if seconds < 3600:
+        return f"{int(seconds // 60)} min ago"
+    if seconds < 86400:
+        return f"{int(seconds // 3600)} h ago"
+    return f"{int(seconds // 86400)} days ago"
+
+
+def format_value(value, template="{}"):
+    """Format a snapshot field, showing a dash for fields a lite answer doesn't carry"""
+    return "—" if value is None else template.format(value)
+
+
+class WeatherDataError(ValueError):
+    """Raised when a wttr.in payload is missing fields the app needs"""
+
+
+class DailyForecast(NamedTuple):
+    date: str
+    max_temp_c: int
+    min_temp_c: int
+    uv_index: int
+    sunrise: str
+    sunset: str
+    description: str  # conditions around midday
+    weather_code: int
+    chance_of_rain: int
+
+
+class HourlyPoint(NamedTuple):
+    date: str
+    hour: int
+    temp_c: int
+    chance_of_rain: int
+    precip_mm: float
+    wind_kmph: int
+    wind_degree: int
+    weather_code: int
+
+
+class WeatherSnapshot(NamedTuple):
+    """The subset of a j1 payload the UI and cache need, with numbers converted once"""
+    area: str
+    country: str
+    temp_c: int
+    feels_like_c: int
+    description: str
+    weather_code: int
+    wind_kmph: int
+    wind_dir: str
+    wind_degree: int
+    humidity: int
+    pressure: int
+    visibility: int
+    cloudcover: int
+    precip_mm: float
+    observed_at: str
+    forecast: tuple = ()  # DailyForecast for today, tomorrow, ...
+    partial: bool = False  # current conditions only, some fields are None
+    hourly: tuple = ()  # HourlyPoint every three hours for the first HOURLY_DAYS days
+
+
+def _parse_day(day):
+    midday = day['hourly'][4]
+    astronomy = day['astronomy'][0]
+    return DailyForecast(
+        date=day['date'],
+        max_temp_c=int(day['maxtempC']),
+        min_temp_c=int(day['mintempC']),
+        uv_index=int(day['uvIndex']),
+        sunrise=astronomy['sunrise'],
+        sunset=astronomy['sunset'],
+        description=midday['weatherDesc'][0]['value'].strip(),
+        weather_code=int(midday['weatherCode']),
+        chance_of_rain=int(midday['chanceofrain']),
+    )
+
+
+def _parse_hours(day):
+    date = day['date']
+    return [
+        HourlyPoint(
+            date=date,
+            hour=int(hour['time']) // 100,
+            temp_c=int(hour['tempC']),
+            chance_of_rain=int(hour['chanceofrain']),
+            precip_mm=float(hour['precipMM']),
+            wind_kmph=int(hour['windspeedKmph']),
+            wind_degree=int(hour['winddirDegree']),
+            weather_code=int(hour['weatherCode']),
+        )
+        for hour in day['hourly']
+    ]
+
+
+def parse_j1(payload):
+    """Parse a wttr.in ?format=j1 payload (bytes, str or decoded dict) into a WeatherSnapshot.
+    
+    Only the fields the app uses are kept, so the rest of the payload (unused
+    hourly fields, area data) can be garbage collected straight away.
+    """
+    try:
+        data = json_loads(payload) if isinstance(payload, (bytes, str)) else payload
+        current = data['current_condition'][0]
+        location = data['nearest_area'][0]
+        snapshot = WeatherSnapshot(
+            area=location['areaName'][0]['value'],
+            country=location['country'][0]['value'],
+            temp_c=int(current['temp_C']),
+            feels_like_c=int(current['FeelsLikeC']),
+            description=current['weatherDesc'][0]['value'].strip(),
+            weather_code=int(current['weatherCode']),
+            wind_kmph=int(current['windspeedKmph']),
+            wind_dir=current['winddir16Point'],
+            wind_degree=int(current['winddirDegree']),
+            humidity=int(current['humidity']),
+            pressure=int(current['pressure']),
+            visibility=int(current['visibility']),
+            cloudcover=int(current['cloudcover']),
+            precip_mm=float(current['precipMM']),
+            observed_at=current.get('localObsDateTime', ""),
+        )
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        raise WeatherDataError(f"Unable to parse weather data: {e!r}") from None
+    
+    # The forecast is optional; a malformed day just ends it early
+    forecast = []
+    hourly = []
+    for day in data.get('weather', ()):
+        try:
+            parsed = _parse_day(day)
+            hours = _parse_hours(day) if len(forecast) < HOURLY_DAYS else ()
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            log.warning("Error parsing forecast: %r", e)
+            break
+        forecast.append(parsed)
+        hourly.extend(hours)
+    return snapshot._replace(forecast=tuple(forecast), hourly=tuple(hourly))
+
+
+def clock_minutes(text):
+    """Minutes since midnight of a wttr.in time ("07:45 AM"); None for "No sunrise" and the like"""
+    try:
+        parsed = datetime.strptime(text.strip(), "%I:%M %p")
+    except ValueError:
+        return None
+    return parsed.hour * 60 + parsed.minute
+
+
+def is_night(minutes, day):
+    """Whether minutes past midnight is outside day's (a DailyForecast) sunrise to sunset"""
+    sunrise = clock_minutes(day.sunrise)
+    sunset = clock_minutes(day.sunset)
+    if minutes is None or sunrise is None or sunset is None:
+        return False
+    return not sunrise <= minutes < sunset
+
+
+def weather_icon(code, description="", night=False):
+    """Icon name (a key of ICON_EMOJI) for a weatherCode, falling back to the description"""
+    kind = WEATHER_CODE_ICONS.get(code)
+    if kind is None:
+        description = description.lower()
+        kind = next((kind for words, kind in DESCRIPTION_ICONS if any(word in description for word in words)),
+                    "partly-cloudy")
+    if kind in ("clear", "partly-cloudy"):
+        return f"{kind}-night" if night else f"{kind}-day"
+    return kind
+
+
+def snapshot_icon(snapshot):
+    """Icon for the current conditions, at night between today's sunset and sunrise"""
+    night = False
+    if snapshot.forecast and snapshot.observed_at:
+        # localObsDateTime: "2024-05-01 09:21 PM"
+        night = is_night(clock_minutes(snapshot.observed_at.partition(" ")[2]), snapshot.forecast[0])
+    return weather_icon(snapshot.weather_code, snapshot.description, night)
+
+
+# wttr.in draws the wind as an arrow pointing where it blows to
+WIND_ARROWS = {
+    "↓": ("N", 0), "↙": ("NE", 45), "←": ("E", 90), "↖": ("SE", 135),
+    "↑": ("S", 180), "↗": ("SW", 225), "→": ("W", 270), "↘": ("NW", 315),
+}
+# Arrows in compass order, for drawing a wind direction given in degrees
+WIND_ARROWS_BY_OCTANT = [arrow for arrow, _ in sorted(WIND_ARROWS.items(), key=lambda item: item[1][1])]
+NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?")
+
+
+def _number(text, convert=int):
+    match = NUMBER_RE.search(text)
+    if match is None:
+        raise ValueError(f"no number in {text!r}")
+    return convert(float(match.group()))
+
+
+def parse_lite(text):
+    """Parse a LITE_FORMAT line ("London|+13°C|+11°C|Partly cloudy|↙11km/h|71%|1015hPa|0.0mm")
+    into a partial WeatherSnapshot"""
+    fields = text.strip().split("|")
+    if len(fields) != 8:
+        raise WeatherDataError(f"Unable to parse weather data: {text[:80]!r}")
+    location, temp, feels, description, wind, humidity, pressure, precip = fields
+    area, _, country = location.partition(",")
+    wind_dir, wind_degree = WIND_ARROWS.get(wind[:1], (None, None))
+    try:
+        return WeatherSnapshot(
+            area=area.strip(),
+            country=country.strip(),
+            temp_c=_number(temp),
+            feels_like_c=_number(feels),
+            description=description.strip(),
+            weather_code=None,
+            wind_kmph=_number(wind),
+            wind_dir=wind_dir,
+            wind_degree=wind_degree,
+            humidity=_number(humidity),
+            pressure=_number(pressure),
+            visibility=None,
+            cloudcover=None,
+            precip_mm=_number(precip, float),
+            observed_at="",
+            partial=True,
+        )
+    except ValueError as e:
+        raise WeatherDataError(f"Unable to parse weather data: {e}") from None
+
+
+def snapshot_to_json(snapshot):
+    """Serialize a snapshot as a compact JSON array for the disk cache"""
+    return json.dumps(snapshot, separators=(",", ":"), ensure_ascii=False)
+
+
+def snapshot_from_json(body):
+    fields = json_loads(body)
+    if not isinstance(fields, list) or len(fields) > len(WeatherSnapshot._fields):
+        raise ValueError("not a serialized WeatherSnapshot")
+    snapshot = WeatherSnapshot(*fields)
+    return snapshot._replace(
+        forecast=tuple(DailyForecast(*day) for day in snapshot.forecast),
+        hourly=tuple(HourlyPoint(*point) for point in snapshot.hourly),
+    )
+
+
+class Span:
+    __slots__ = ("tracer", "name", "attrs", "started")
+    
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+        self.started = 0.0
+    
+    def set(self, key, value):
+        self.attrs[key] = value
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer.record(self.name, time.perf_counter() - self.started, **self.attrs)
+        return False
+
+
+class NoopSpan:
+    __slots__ = ()
+    
+    def set(self, key, value):
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = NoopSpan()
+
+
+class Tracer:
+    """Records timed spans of the lookup hot path into a bounded ring buffer.
+    
+    While disabled, span() hands out a shared no-op context manager and
+    record() returns straight away, so the instrumentation can stay in place.
+    """
+    
+    def __init__(self, enabled=False, capacity=TRACE_CAPACITY):
+        self.enabled = enabled
+        self.spans = deque(maxlen=capacity)
+    
+    def span(self, name, **attrs):
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attrs)
+    
+    def record(self, name, seconds, **attrs):
+        if not self.enabled:
+            return
+        attrs["ts"] = time.time()
+        attrs["name"] = name
+        attrs["ms"] = round(seconds * 1000, 3)
+        attrs["thread"] = threading.current_thread().name
+        self.spans.append(attrs)
+    
+    def recent(self, count):
+        return list(self.spans)[-count:]
+    
+    def export_jsonl(self, path):
+        """Append the recorded spans to path, one JSON object per line"""
+        spans = list(self.spans)
+        with open(path, "a", encoding="utf-8") as fh:
+            for span in spans:
+                fh.write(json.dumps(span, ensure_ascii=False) + "\n")
+        return len(spans)
+
+
+tracer = Tracer(enabled=os.environ.get("WEATHERME_TRACE") == "1")
+
+
+def rss_bytes():
+    """Resident set size of this process, or None where it can't be read cheaply"""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if sys.platform == "win32":
+        import ctypes
+        from ctypes import wintypes
+        
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                (name, ctypes.c_size_t) for name in (
+                    "PeakWorkingSetSize", "WorkingSetSize", "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                    "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage", "PagefileUsage", "PeakPagefileUsage",
+                )
+            ]
+        
+        counters = ProcessMemoryCounters(cb=ctypes.sizeof(ProcessMemoryCounters))
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+    return None
+
+
+def tk_counts(root):
+    """Live Tk objects: widgets, Tcl commands (each Python callback is one), pending after calls and images"""
+    widgets = 0
+    stack = [root]
+    while stack:
+        widget = stack.pop()
+        widgets += 1
+        stack.extend(widget.winfo_children())
+    splitlist = root.tk.splitlist
+    return {
+        "widgets": widgets,
+        "commands": len(splitlist(root.tk.call("info", "commands"))),
+        "after": len(splitlist(root.tk.call("after", "info"))),
+        "images": len(splitlist(root.tk.call("image", "names"))),
+    }
+
+
+class CacheEntry:
+    """A single cached response: the decoded value, the raw body used for sizing and
+    persistence, and any HTTP validators needed to revalidate it"""
+    __slots__ = ("value", "body", "size", "stored_at", "etag", "last_modified")
+    
+    def __init__(self, value, body, stored_at, etag=None, last_modified=None):
+        self.value = value
+        self.body = body
+        self.size = len(body.encode("utf-8"))
+        self.stored_at = stored_at
+        self.etag = etag
+        self.last_modified = last_modified
+    
+    def age(self):
+        return time.time() - self.stored_at
+
+
+class ResponseCache:
+    """TTL + LRU cache of weather responses, bounded by entry count and bytes.
+    
+    When a path is given, bodies are also written to a small SQLite store so
+    cached answers survive restarts; it is pruned to the same bounds, oldest
+    first. Expired entries are kept until evicted, they just stop counting as
+    hits.
+    """
+    
+    def __init__(self, ttl=CACHE_TTL, max_entries=CACHE_MAX_ENTRIES,
+                 max_bytes=CACHE_MAX_BYTES, path=None, loads=snapshot_from_json):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.loads = loads
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._open_db(path)
+    
+    def _open_db(self, path):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, stored_at REAL NOT NULL, "
+                "etag TEXT, last_modified TEXT, body TEXT NOT NULL)"
+            )
+            self._db.commit()
+        except (OSError, sqlite3.Error) as e:
+            log.warning("Disk cache disabled: %s", e)
+            self._db = None
+    
+    def get(self, key):
+        """Return the cached value for key if it is still fresh, else None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._load(key)
+            if entry is None or entry.age() > self.ttl:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.value
+    
+    def get_stale(self, key):
+        """Return the entry for key even if it has expired (stale-while-revalidate), else None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._load(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if entry.age() > self.ttl:
+                    self.stale_hits += 1
+            return entry
+    
+    def get_entry(self, key):
+        """Return the entry for key whether or not it has expired, without touching the counters"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._load(key)
+            return entry
+    
+    def put(self, key, value, body, etag=None, last_modified=None):
+        with self._lock:
+            entry = CacheEntry(value, body, time.time(), etag, last_modified)
+            self._store(key, entry)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO responses (key, stored_at, etag, last_modified, body) "
+                        "VALUES (?, ?, ?, ?, ?)",
+                        (key, entry.stored_at, etag, last_modified, body)
+                    )
+                    self._prune_db()
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    log.warning("Unable to persist cache entry %r: %s", key, e)
+    
+    def touch(self, key):
+        """Mark an entry as fresh again after the upstream confirmed it is unchanged"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.stored_at = time.time()
+            self._entries.move_to_end(key)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "UPDATE responses SET stored_at = ? WHERE key = ?", (entry.stored_at, key)
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    log.warning("Unable to refresh cache entry %r: %s", key, e)
+    
+    def _store(self, key, entry):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+        self._entries[key] = entry
+        self._bytes += entry.size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            self.evictions += 1
+    
+    def _prune_db(self):
+        """Drop the oldest stored responses beyond max_entries or max_bytes (of UTF-8 body)"""
+        rows = self._db.execute(
+            "SELECT key, length(CAST(body AS BLOB)) FROM responses ORDER BY stored_at DESC"
+        ).fetchall()
+        total = 0
+        stale = []
+        for i, (key, size) in enumerate(rows):
+            total += size
+            if i >= self.max_entries or total > self.max_bytes:
+                stale.append((key,))
+        if stale:
+            self._db.executemany("DELETE FROM responses WHERE key = ?", stale)
+    
+    def _load(self, key):
+        """Pull an entry from the disk store into memory"""
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT stored_at, etag, last_modified, body FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            stored_at, etag, last_modified, body = row
+            entry = CacheEntry(self.loads(body), body, stored_at, etag, last_modified)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            log.warning("Ignoring unreadable cache entry %r: %s", key, e)
+            return None
+        self._store(key, entry)
+        return self._entries.get(key)
+    
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale_hits": self.stale_hits,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+    
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+class CircuitOpenError(ConnectionError):
+    """Raised without sending anything while the circuit breaker is open.
+    
+    Not a requests exception, so that defining it doesn't import requests.
+    """
+
+
+def is_retryable(error):
+    """Whether a failed GET is worth repeating: connection problems, timeouts, 429 and 5xx"""
+    if isinstance(error, CircuitOpenError):
+        return False
+    if isinstance(error, requests.HTTPError):
+        status = error.response.status_code if error.response is not None else 0
+        return status == 429 or status >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+class CircuitBreaker:
+    """Fail fast while the upstream is down.
+    
+    After threshold consecutive failures the circuit opens and requests are
+    rejected without being sent for reset_timeout seconds. Then a single
+    trial request is let through (half-open); its outcome closes the circuit
+    or opens it for another reset_timeout.
+    """
+    
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_RESET_SECONDS):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+    
+    def retry_in(self):
+        """Seconds until the circuit lets a trial request through"""
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+    
+    def before_request(self):
+        with self._lock:
+            if self.state == "closed":
+                return
+            if self.state == "open" and self.retry_in() == 0:
+                self.state = "half-open"
+                return
+            self.rejected += 1
+            raise CircuitOpenError(f"wttr.in is not responding, trying again in {self.retry_in():.0f}s")
+    
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half-open" or self.failures >= self.threshold:
+                if self.state != "open":
+                    self.trips += 1
+                    log.warning("Circuit breaker opened after %d failures", self.failures)
+                self.state = "open"
+                self.opened_at = time.monotonic()
+    
+    def release(self):
+        """A request ended without showing whether the upstream is up (e.g. a corrupt body).
+        
+        If it was the half-open trial, the circuit goes back to open with its
+        timer already expired, so the next request becomes the trial.
+        """
+        with self._lock:
+            if self.state == "half-open":
+                self.state = "open"
+
+
+class WeatherClient:
+    """HTTP transport for wttr.in.
+    
+    Owns one pooled keep-alive session so repeat lookups reuse the TCP/TLS
+    connection, and revalidates cached responses with ETag/Last-Modified
+    instead of downloading the full j1 payload again.
+    
+    Network errors, 429 and 5xx answers are retried with exponential backoff
+    and jitter. With hedge=True a request still running after the recent p95
+    latency gets a duplicate, and whichever answers first wins. A circuit
+    breaker makes requests fail fast while the upstream keeps failing.
+    """
+    
+    def __init__(self, cache, base_url=BASE_URL, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), pool_size=4,
+                 retries=FETCH_RETRIES, hedge=HEDGE_REQUESTS, breaker=None, limiter=None):
+        self.cache = cache
+        self.base_url = base_url.rstrip("/") + "/"
+        self.timeout = timeout
+        self.retries = retries
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter  # TokenBucket taken from before every attempt, retries included
+        self._local = threading.local()
+        self.revalidated = 0
+        self.counters = {"retries": 0, "hedges": 0, "hedge_wins": 0}
+        self._latencies = deque(maxlen=HEDGE_WINDOW)
+        self._lock = threading.Lock()
+        self._hedge_pool = None
+        self._pool_size = pool_size
+        self._session = None
+        self.adapter = None
+    
+    @property
+    def session(self):
+        """The pooled session, created (and requests imported) on first use"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    from requests.adapters import HTTPAdapter
+                    session = requests.Session()
+                    self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size)
+                    session.mount("https://", self.adapter)
+                    session.mount("http://", self.adapter)
+                    session.headers.update({
+                        "Accept": "application/json",
+                        "Accept-Encoding": "gzip, deflate",
+                        "Connection": "keep-alive",
+                    })
+                    self._session = session
+        return self._session
+    
+    def url(self, city, lite=False):
+        # Quoted whole, so that a "?", "#", "&" or "/" in a name stays part of the city
+        path = quote(city, safe='')
+        if lite:
+            return f"{self.base_url}{path}?format={quote(LITE_FORMAT, safe='')}&m"
+        return f"{self.base_url}{path}?format=j1"
+    
+    def fetch(self, city, lite=False):
+        """Fetch and parse the weather for city, revalidating any cached copy.
+        
+        With lite=True only the current conditions are requested.
+        """
+        key = cache_key(city, lite)
+        self._local.attempts = 0
+        with tracer.span("fetch", city=key, kind="lite" if lite else "j1"):
+            return self._fetch(city, key, lite)
+    
+    def attempts(self):
+        """Requests sent by this thread's last fetch(), retries included"""
+        return getattr(self._local, "attempts", 0)
+    
+    def _fetch(self, city, key, lite):
+        entry = self.cache.get_entry(key)
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        
+        response, body = self._get(self.url(city, lite), headers)
+        if response.status_code == 304 and entry is not None:
+            self.revalidated += 1
+            self.cache.touch(key)
+            return entry.value
+        
+        response.raise_for_status()
+        if lite:
+            with tracer.span("parse"):
+                snapshot = parse_lite(body.decode(response.encoding or "utf-8", "replace"))
+        else:
+            with tracer.span("json.decode"):
+                try:
+                    data = json_loads(body)
+                except ValueError as e:
+                    raise WeatherDataError(f"Unable to parse weather data: {e}") from None
+            with tracer.span("parse"):
+                snapshot = parse_j1(data)
+        self.cache.put(
+            key, snapshot, snapshot_to_json(snapshot),
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified")
+        )
+        return snapshot
+    
+    def fetch_body(self, city, lite=False, headers=None):
+        """Fetch the upstream answer for city without parsing or caching it; returns (response, body)"""
+        return self._get(self.url(city, lite), headers or {})
+    
+    def _get(self, url, headers):
+        """GET url through the circuit breaker, with retries and hedging; returns (response, body)"""
+        attempt = 0
+        while True:
+            self.breaker.before_request()
+            if self.limiter is not None:
+                self.limiter.acquire()
+            self._local.attempts = getattr(self._local, "attempts", 0) + 1
+            settled = False
+            try:
+                response, body = self._hedged(url, headers) if self.hedge else self._request(url, headers)
+                if response.status_code == 429 or response.status_code >= 500:
+                    response.raise_for_status()
+                self.breaker.record_success()
+                settled = True
+                return response, body
+            except requests.RequestException as e:
+                if not is_retryable(e):
+                    raise
+                self.breaker.record_failure()
+                settled = True
+                if attempt >= self.retries:
+                    raise
+                error = e
+            finally:
+                # Every attempt has to settle the breaker, or a half-open trial that fails
+                # any other way would leave it rejecting requests for good
+                if not settled:
+                    self.breaker.release()
+            attempt += 1
+            self._count("retries")
+            delay = random.uniform(0, min(FETCH_MAX_BACKOFF, FETCH_BACKOFF * 2 ** (attempt - 1)))
+            log.debug("Retrying %s in %.2fs after %s", url, delay, error)
+            time.sleep(delay)
+    
+    def _request(self, url, headers):
+        started = time.perf_counter()
+        # requests doesn't expose DNS/connect timings, so http.request covers
+        # DNS + connect + time to first byte and notes whether a connection was opened
+        with tracer.span("http.request") as span:
+            opened = self.connections_opened() if tracer.enabled else 0
+            response = self.session.get(url, headers=headers, timeout=self.timeout, stream=True)
+            span.set("status", response.status_code)
+            if tracer.enabled:
+                span.set("new_connection", self.connections_opened() > opened)
+        with tracer.span("http.transfer") as span:
+            body = response.content
+            span.set("bytes", len(body))
+        if response.status_code < 500:
+            self._latencies.append(time.perf_counter() - started)
+        return response, body
+    
+    def hedge_delay(self):
+        """How long to wait before hedging: the recent p95 latency, or None while there is too little history"""
+        latencies = sorted(self._latencies)
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(HEDGE_MIN_DELAY, latencies[int(len(latencies) * 0.95) - 1])
+    
+    def _hedged(self, url, headers):
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._request(url, headers)
+        if self._hedge_pool is None:
+            with self._lock:
+                if self._hedge_pool is None:
+                    self._hedge_pool = ThreadPoolExecutor(max_workers=self._pool_size * 2, thread_name_prefix="hedge")
+        
+        primary = self._hedge_pool.submit(self._request, url, headers)
+        try:
+            return primary.result(timeout=delay)
+        except FutureTimeout:
+            pass
+        
+        # The slower of the two is left to finish in the background and dropped
+        self._count("hedges")
+        backup = self._hedge_pool.submit(self._request, url, headers)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except requests.RequestException as e:
+                    error = e
+                    continue
+                if future is backup:
+                    self._count("hedge_wins")
+                return result
+        raise error
+    
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+    
+    def stats(self):
+        return {
+            **self.counters,
+            "revalidated": self.revalidated,
+            "breaker": self.breaker.state,
+            "breaker_trips": self.breaker.trips,
+            "breaker_rejected": self.breaker.rejected,
+        }
+    
+    def connections_opened(self):
+        """Total connections the session's pools have opened so far"""
+        if self.adapter is None:
+            return 0
+        pools = self.adapter.poolmanager.pools
+        return sum(getattr(pools.get(key), "num_connections", 0) for key in pools.keys())
+    
+    def close(self):
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False)
+        if self._session is not None:
+            self._session.close()
+
+
+class RequestScheduler:
+    """Runs fetches on a bounded worker pool.
+    
+    Every search gets a generation ID and only the newest one is current, so
+    results of superseded searches can be dropped (and their queued work
+    cancelled). Requests for a key that is already in flight are coalesced onto
+    the same future, and repeat submits of a key inside the debounce window are
+    ignored.
+    """
+    
+    def __init__(self, max_workers=FETCH_WORKERS, debounce=DEBOUNCE_SECONDS):
+        self.debounce = debounce
+        self.generation = 0
+        self.coalesced = 0
+        self.debounced = 0
+        self.cancelled = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="weather-fetch")
+        # Re-entrant: cancelling a future runs its done callback in this thread
+        self._lock = threading.RLock()
+        self._inflight = {}
+        self._last_key = None
+        self._last_submit = 0.0
+    
+    def advance(self):
+        """Start a new generation, superseding everything submitted so far"""
+        with self._lock:
+            self.generation += 1
+            for future in list(self._inflight.values()):
+                if future.cancel():
+                    self.cancelled += 1
+            return self.generation
+    
+    def is_current(self, generation):
+        return generation == self.generation
+    
+    def submit(self, key, fn, *args, supersede=True):
+        """Schedule fn(*args) for key.
+        
+        With supersede=False the work joins the current generation instead of
+        starting a new one (e.g. the forecast half of a tiered search).
+        Returns (generation, future), or None if the submit was debounced.
+        """
+        with self._lock:
+            if supersede:
+                now = time.monotonic()
+                if key == self._last_key and now - self._last_submit < self.debounce:
+                    self.debounced += 1
+                    return None
+                self._last_key = key
+                self._last_submit = now
+            
+            future = self._inflight.pop(key, None)
+            generation = self.advance() if supersede else self.generation
+            if future is not None and not future.done():
+                self.coalesced += 1
+            else:
+                future = self._executor.submit(fn, *args)
+                future.add_done_callback(lambda f, key=key: self._finished(key, f))
+            self._inflight[key] = future
+            return generation, future
+    
+    def _finished(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+    
+    def stats(self):
+        with self._lock:
+            return {
+                "generation": self.generation,
+                "in_flight": len(self._inflight),
+                "coalesced": self.coalesced,
+                "debounced": self.debounced,
+                "cancelled": self.cancelled,
+            }
+    
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def snapshot_to_dict(snapshot):
+    """A snapshot as plain dicts, for JSON meant to be read by other tools"""
+    data = snapshot._asdict()
+    data['forecast'] = [day._asdict() for day in snapshot.forecast]
+    data['hourly'] = [point._asdict() for point in snapshot.hourly]
+    return data
+
+
+def read_cities(lines):
+    """City names from an iterable of lines, skipping blanks and # comments"""
+    for line in lines:
+        city = line.strip()
+        if city and not city.startswith("#"):
+            yield city
+
+
+class TokenBucket:
+    """Thread-safe token bucket: rate tokens per second, with up to burst saved up"""
+    
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self):
+        """Take one token, sleeping until it is available"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class BatchRunner:
+    """Fetch many cities without a window and write each result as an NDJSON line.
+    
+    Cities are read lazily and at most two per worker are queued at a time,
+    so memory stays flat however long the input is. Lines are written in
+    completion order as soon as each city finishes.
+    """
+    
+    def __init__(self, client, out, workers=BATCH_WORKERS, lite=False):
+        self.client = client
+        self.out = out
+        self.workers = workers
+        self.lite = lite
+        self.ok = 0
+        self.failed = 0
+        self.latencies = []  # reservoir sample of fetch times in ms
+        self.seen = 0
+        self._random = random.Random()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(workers * 2)
+        self._last_progress = 0.0
+        self.started = 0.0
+    
+    def run(self, cities):
+        self.started = self._last_progress = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch") as pool:
+            for city in cities:
+                self._slots.acquire()
+                pool.submit(self.fetch_one, city).add_done_callback(self._done)
+        return self.stats()
+    
+    def fetch_one(self, city):
+        """Fetch one city (the client handles retries and the rate limit); returns the record to write"""
+        started = time.perf_counter()
+        try:
+            weather = snapshot_to_dict(self.client.fetch(city, lite=self.lite))
+        except (requests.RequestException, CircuitOpenError, WeatherDataError) as e:
+            error = str(e)
+        except Exception as e:
+            # Anything else is a bug, but the city still gets its line in the output
+            log.warning("Batch: unexpected error for %r", city, exc_info=True)
+            error = f"{type(e).__name__}: {e}"
+        else:
+            return {"city": city, "ok": True, "attempts": self.client.attempts(),
+                    "ms": round((time.perf_counter() - started) * 1000, 1), "weather": weather}
+        return {"city": city, "ok": False, "attempts": self.client.attempts(),
+                "ms": round((time.perf_counter() - started) * 1000, 1), "error": error}
+    
+    def _done(self, future):
+        try:
+            record = future.result()
+            line = json.dumps(record, separators=(",", ":"), ensure_ascii=False)
+            with self._lock:
+                self.out.write(line + "\n")
+                self.out.flush()
+                if record["ok"]:
+                    self.ok += 1
+                else:
+                    self.failed += 1
+                self._sample(record["ms"])
+                now = time.perf_counter()
+                if now - self._last_progress >= BATCH_PROGRESS_SECONDS:
+                    self._last_progress = now
+                    done = self.ok + self.failed
+                    log.info("Batch: %d done (%d failed), %.1f cities/s", done, self.failed, done / (now - self.started))
+        finally:
+            self._slots.release()
+    
+    def _sample(self, ms):
+        self.seen += 1
+        if len(self.latencies) < BATCH_LATENCY_SAMPLES:
+            self.latencies.append(ms)
+        else:
+            i = self._random.randrange(self.seen)
+            if i < BATCH_LATENCY_SAMPLES:
+                self.latencies[i] = ms
+    
+    def stats(self):
+        elapsed = time.perf_counter() - self.started
+        done = self.ok + self.failed
+        latencies = sorted(self.latencies)
+        
+        def percentile(q):
+            return latencies[min(len(latencies) - 1, int(q * len(latencies)))] if latencies else 0.0
+        
+        return {
+            "cities": done,
+            "ok": self.ok,
+            "failed": self.failed,
+            "retries": self.client.counters["retries"],
+            "seconds": round(elapsed, 2),
+            "cities_per_second": round(done / elapsed, 2) if elapsed > 0 else 0.0,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "max_ms": latencies[-1] if latencies else 0.0,
+        }
+
+
+def run_batch(args):
+    """--batch: fetch every city in args.batch ('-' for stdin) and write NDJSON to args.output or stdout"""
+    cache = ResponseCache(ttl=0, max_entries=args.workers)
+    limiter = TokenBucket(args.rate) if args.rate > 0 else None
+    # No hedging: duplicate requests would only eat into the rate limit. A breaker that never
+    # opens: a brief upstream problem should cost retries, not fail whole stretches of the input
+    client = WeatherClient(cache, base_url=args.base_url, pool_size=args.workers, retries=args.retries, hedge=False,
+                           breaker=CircuitBreaker(threshold=math.inf), limiter=limiter)
+    source = sys.stdin if args.batch == "-" else open(args.batch, encoding="utf-8")
+    out = sys.stdout if args.output in (None, "-") else open(args.output, "w", encoding="utf-8")
+    try:
+        runner = BatchRunner(client, out, workers=args.workers, lite=args.lite)
+        stats = runner.run(read_cities(source))
+    finally:
+        client.close()
+        if source is not sys.stdin:
+            source.close()
+        if out is not sys.stdout:
+            out.close()
+    log.info("Batch finished: %s", json.dumps(stats))
+    return 1 if stats["failed"] and not stats["ok"] else 0
+
+
+class WeatherProxy:
+    """Shared cache in front of wttr.in for many app instances (--serve).
+    
+    Raw j1 and lite bodies are cached once for every client. Concurrent
+    misses for the same city are coalesced onto one upstream request by a
+    RequestScheduler, so upstream traffic grows with the number of distinct
+    cities rather than the number of clients. Answers are parsed before they
+    are cached, so a broken upstream body is never shared, and an expired
+    entry is served (marked stale) if the upstream cannot be reached.
+    """
+    
+    def __init__(self, base_url=BASE_URL, cache_path=PROXY_CACHE_PATH, workers=PROXY_WORKERS):
+        self.cache = ResponseCache(max_entries=PROXY_MAX_ENTRIES, max_bytes=PROXY_MAX_BYTES, path=cache_path, loads=str)
+        self.client = WeatherClient(self.cache, base_url=base_url, pool_size=workers)
+        self.scheduler = RequestScheduler(max_workers=workers, debounce=0)
+        self.counters = {"requests": 0, "hits": 0, "misses": 0, "upstream": 0, "stale": 0, "errors": 0}
+        self._lock = threading.Lock()
+    
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+    
+    def get(self, city, lite=False):
+        """The cache entry for city, refreshing it first if it has expired; returns (entry, stale)"""
+        self._count("requests")
+        key = cache_key(city, lite)
+        entry = self.cache.get_entry(key)
+        if entry is not None and entry.age() < self.cache.ttl:
+            self._count("hits")
+            return entry, False
+        
+        self._count("misses")
+        _, future = self.scheduler.submit(key, self._refresh, city, lite, key, supersede=False)
+        try:
+            return future.result(), False
+        except (requests.RequestException, CircuitOpenError, WeatherDataError) as e:
+            self._count("errors")
+            if entry is None or (isinstance(e, requests.HTTPError) and not is_retryable(e)):
+                raise
+            log.warning("Serving stale %r: %s", key, e)
+            self._count("stale")
+            return entry, True
+    
+    def get_snapshot(self, city):
+        """The parsed snapshot of city's j1 answer as JSON, cached alongside it"""
+        entry, stale = self.get(city)
+        key = cache_key(city) + "#snapshot"
+        snapshot = self.cache.get_entry(key)
+        if snapshot is None or snapshot.stored_at < entry.stored_at:
+            body = json.dumps(snapshot_to_dict(parse_j1(entry.value)), separators=(",", ":"), ensure_ascii=False)
+            self.cache.put(key, body, body, etag=f'"{sha1(body.encode()).hexdigest()[:16]}"',
+                           last_modified=entry.last_modified)
+            snapshot = self.cache.get_entry(key)
+        return snapshot, stale
+    
+    def _refresh(self, city, lite, key):
+        """Runs on a scheduler worker: revalidate or refetch key from upstream"""
+        entry = self.cache.get_entry(key)
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+        
+        self._count("upstream")
+        response, body = self.client.fetch_body(city, lite, headers)
+        if response.status_code == 304 and entry is not None:
+            self.cache.touch(key)
+            return entry
+        response.raise_for_status()
+        
+        text = body.decode(response.encoding or "utf-8", "replace")
+        if lite:
+            parse_lite(text)
+        else:
+            parse_j1(text)
+        etag = response.headers.get("ETag") or f'"{sha1(body).hexdigest()[:16]}"'
+        self.cache.put(key, text, text, etag=etag, last_modified=response.headers.get("Last-Modified"))
+        return self.cache.get_entry(key)
+    
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        return {**counters, "coalesced": self.scheduler.coalesced, "cache": self.cache.stats(),
+                "client": self.client.stats()}
+    
+    def close(self):
+        self.scheduler.shutdown()
+        self.client.close()
+        self.cache.close()
+
+
+class ProxyHandler:
+    """Serves /<city>?format=j1, ?format=snapshot and the app's lite format from a WeatherProxy.
+    
+    A mixin for http.server's BaseHTTPRequestHandler, combined in
+    make_proxy_server so the app itself never imports http.server.
+    """
+    server_version = "WeatherME-proxy"
+    protocol_version = "HTTP/1.1"
+    
+    def do_GET(self):
+        proxy = self.server.proxy
+        path, _, query = self.path.partition("?")
+        if path == "/_stats":
+            self.send_body(200, json.dumps(proxy.stats()), "application/json")
+            return
+        
+        city = unquote(path.strip("/"))
+        fmt = parse_qs(query).get("format", ["j1"])[0]
+        if not city or fmt not in ("j1", "snapshot", LITE_FORMAT):
+            self.send_body(400, "Use /<city>?format=j1 or ?format=snapshot\n", "text/plain")
+            return
+        
+        try:
+            if fmt == "snapshot":
+                entry, stale = proxy.get_snapshot(city)
+            else:
+                entry, stale = proxy.get(city, lite=fmt == LITE_FORMAT)
+        except requests.HTTPError as e:
+            status = e.response.status_code if e.response is not None else 502
+            self.send_body(status, e.response.text if e.response is not None else f"{e}\n", "text/plain")
+            return
+        except (requests.RequestException, CircuitOpenError, WeatherDataError) as e:
+            self.send_body(502, f"{e}\n", "text/plain")
+            return
+        
+        headers = {"ETag": entry.etag, "Age": str(int(entry.age()))}
+        if entry.last_modified:
+            headers["Last-Modified"] = entry.last_modified
+        if stale:
+            headers["Warning"] = '110 - "Response is Stale"'
+        if entry.etag and self.headers.get("If-None-Match") == entry.etag:
+            self.send_body(304, None, None, headers)
+        else:
+            self.send_body(200, entry.value, "text/plain" if fmt == LITE_FORMAT else "application/json", headers)
+    
+    def send_body(self, status, text, content_type, headers=None):
+        body = text.encode("utf-8") if text else b""
+        self.send_response(status)
+        if content_type:
+            self.send_header("Content-Type", f"{content_type}; charset=utf-8")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        log.debug("%s %s", self.address_string(), format % args)
+
+
+def make_proxy_server(proxy, host=PROXY_HOST, port=PROXY_PORT):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    handler = type("ProxyRequestHandler", (ProxyHandler, BaseHTTPRequestHandler), {})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.proxy = proxy
+    return server
+
+
+def run_proxy(args):
+    """--serve: run a shared caching proxy until interrupted"""
+    host, _, port = args.serve.rpartition(":")
+    proxy = WeatherProxy(base_url=args.base_url)
+    server = make_proxy_server(proxy, host or PROXY_HOST, int(port))
+    log.info("Serving on http://%s:%d/ (upstream %s)", server.server_address[0], server.server_address[1],
+             proxy.client.base_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        log.info("Proxy stats: %s", json.dumps(proxy.stats()))
+        proxy.close()
+    return 0
+
+
+def load_favorites(path=FAVORITES_PATH):
+    """Return the saved favorites as {city: refresh interval in seconds}"""
+    try:
+        with open(path, encoding="utf-8") as fh:
+            entries = json.load(fh)
+        return {entry["city"]: float(entry.get("interval", REFRESH_INTERVAL)) for entry in entries}
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError, TypeError, KeyError) as e:
+        log.warning("Ignoring unreadable favorites file %s: %s", path, e)
+        return {}
+
+
+def save_favorites(favorites, path=FAVORITES_PATH):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump([{"city": city, "interval": interval} for city, interval in favorites.items()], fh, indent=2)
+    except OSError as e:
+        log.warning("Unable to save favorites: %s", e)
+
+
+def load_state(path=STATE_PATH):
+    """Return the saved UI state, e.g. {"last_city": "London"}"""
+    try:
+        with open(path, encoding="utf-8") as fh:
+            state = json.load(fh)
+        return state if isinstance(state, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        log.warning("Ignoring unreadable state file %s: %s", path, e)
+        return {}
+
+
+def save_state(state, path=STATE_PATH):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump(state, fh)
+    except OSError as e:
+        log.warning("Unable to save state: %s", e)
+
+
+class FavoriteState:
+    __slots__ = ("interval", "next_due", "failures")
+    
+    def __init__(self, interval, next_due):
+        self.interval = interval
+        self.next_due = next_due
+        self.failures = 0
+
+
+class FavoritesRefresher:
+    """Keeps favorite cities warm in the cache so switching between them is instant.
+    
+    Every favorite is refreshed on its own interval plus jitter. Cities the
+    cache still holds fresh are skipped, at most `concurrency` refreshes run
+    at once, upstream failures back off exponentially, and nothing is fetched
+    while paused() is true (e.g. the window is minimized).
+    """
+    
+    def __init__(self, root, cache, scheduler, fetch, paused=lambda: False,
+                 on_refreshed=None, concurrency=REFRESH_CONCURRENCY):
+        self.root = root
+        self.cache = cache
+        self.scheduler = scheduler
+        self.fetch = fetch
+        self.paused = paused
+        self.on_refreshed = on_refreshed
+        self.concurrency = concurrency
+        self.refreshed = 0
+        self.skipped = 0
+        self.failed = 0
+        self._favorites = {}
+        self._inflight = set()
+        self._failures = 0
+        self._backoff_until = 0.0
+        self._after_id = None
+    
+    def set_favorites(self, favorites):
+        """favorites: {city: refresh interval in seconds}"""
+        now = time.monotonic()
+        current = {}
+        for city, interval in favorites.items():
+            state = self._favorites.get(city)
+            if state is None:
+                # Spread the first refreshes of a batch of new favorites out
+                state = FavoriteState(interval, now + random.uniform(0, REFRESH_TICK_MS / 1000))
+            state.interval = interval
+            current[city] = state
+        self._favorites = current
+    
+    def start(self):
+        if self._after_id is None:
+            self._after_id = self.root.after(REFRESH_TICK_MS, self.tick)
+    
+    def stop(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+    
+    def _jitter(self, interval):
+        return random.uniform(0, interval * REFRESH_JITTER)
+    
+    def tick(self):
+        self._after_id = self.root.after(REFRESH_TICK_MS, self.tick)
+        now = time.monotonic()
+        if self.paused() or now < self._backoff_until:
+            return
+        
+        for city, state in self._favorites.items():
+            if len(self._inflight) >= self.concurrency:
+                break
+            if city in self._inflight or now < state.next_due:
+                continue
+            
+            entry = self.cache.get_entry(cache_key(city))
+            remaining = self.cache.ttl - entry.age() if entry is not None else 0
+            if remaining > REFRESH_TICK_MS / 1000:
+                # Still fresh: come back just before it expires, or at the next interval
+                self.skipped += 1
+                state.next_due = now + min(state.interval, remaining) + self._jitter(REFRESH_TICK_MS / 1000)
+                continue
+            
+            ticket = self.scheduler.submit(cache_key(city), self.fetch, city, supersede=False)
+            self._inflight.add(city)
+            ticket[1].add_done_callback(lambda f, city=city: self.root.after(0, self._done, city, f))
+    
+    def _done(self, city, future):
+        self._inflight.discard(city)
+        state = self._favorites.get(city)
+        now = time.monotonic()
+        if future.cancelled():
+            # Superseded by a user search; try again on a later tick
+            if state is not None:
+                state.next_due = now + self._jitter(state.interval)
+            return
+        
+        error = future.exception()
+        if error is not None:
+            self.failed += 1
+            self._failures += 1
+            backoff = min(REFRESH_MAX_BACKOFF, REFRESH_BACKOFF * 2 ** (self._failures - 1))
+            self._backoff_until = now + backoff
+            if state is not None:
+                state.failures += 1
+                state.next_due = now + backoff + self._jitter(backoff)
+            log.info("Refreshing favorite %r failed (%s), backing off %.0f s", city, error, backoff)
+            return
+        
+        self.refreshed += 1
+        self._failures = 0
+        if state is not None:
+            state.failures = 0
+            state.next_due = now + state.interval + self._jitter(state.interval)
+        if self.on_refreshed is not None:
+            self.on_refreshed(city, future.result())
+    
+    def stats(self):
+        return {
+            "favorites": len(self._favorites),
+            "in_flight": len(self._inflight),
+            "refreshed": self.refreshed,
+            "skipped": self.skipped,
+            "failed": self.failed,
+        }
+
+
+class DailyStat(NamedTuple):
+    day: int  # days since the epoch (UTC)
+    low: float
+    high: float
+    mean: float
+
+
+class CitySeries:
+    """One city's history on disk: a file per column of fixed-width values, plus a day index.
+    
+    Samples are appended in time order, so the index only needs the first row
+    of every day (two uint32 per day) to find any time range without reading
+    the time column.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self.days = array("I")
+        self.starts = array("I")
+        self.last_time = 0
+        self.last_observed = None
+        os.makedirs(path, exist_ok=True)
+        self._open()
+    
+    def column_path(self, name):
+        return os.path.join(self.path, name)
+    
+    def _open(self):
+        # A crash can leave columns of different lengths; keep the rows every column has
+        sizes = []
+        for name, code, _, _ in HISTORY_COLUMNS:
+            try:
+                size = os.path.getsize(self.column_path(name))
+            except FileNotFoundError:
+                size = 0
+            sizes.append(size // array(code).itemsize)
+        self.count = min(sizes)
+        if any(size != self.count for size in sizes):
+            for name, code, _, _ in HISTORY_COLUMNS:
+                with open(self.column_path(name), "ab") as fh:
+                    fh.truncate(self.count * array(code).itemsize)
+        
+        index = array("I")
+        try:
+            with open(self.column_path("index"), "rb") as fh:
+                index.frombytes(fh.read())
+        except FileNotFoundError:
+            pass
+        self.days = index[0::2]
+        self.starts = index[1::2]
+        if self.count:
+            self.last_time = self.read("time", self.count - 1, self.count)[0]
+        # The index is written after the columns, so a crash can leave it listing rows that were
+        # truncated above, or missing the day of the last sample
+        last_day = self.last_time // 86400 if self.count else None
+        if (len(self.days) != len(self.starts) or (self.starts and self.starts[-1] >= max(self.count, 1))
+                or (self.days[-1] if self.days else None) != last_day):
+            self._rebuild_index()
+    
+    def _rebuild_index(self):
+        self.days = array("I")
+        self.starts = array("I")
+        for row, timestamp in enumerate(self.read("time", 0, self.count)):
+            day = timestamp // 86400
+            if not self.days or day != self.days[-1]:
+                self.days.append(day)
+                self.starts.append(row)
+        self._write_index()
+    
+    def _write_index(self):
+        index = array("I", [0]) * (2 * len(self.days))
+        index[0::2] = self.days
+        index[1::2] = self.starts
+        with open(self.column_path("index"), "wb") as fh:
+            index.tofile(fh)
+    
+    def append(self, timestamp, values):
+        """values: {column: value or None}, in the column's units"""
+        for name, code, missing, scale in HISTORY_COLUMNS:
+            value = timestamp if name == "time" else values.get(name)
+            stored = missing if value is None else int(round(value * scale))
+            with open(self.column_path(name), "ab") as fh:
+                array(code, [stored]).tofile(fh)
+        day = timestamp // 86400
+        if not self.days or day != self.days[-1]:
+            self.days.append(day)
+            self.starts.append(self.count)
+            with open(self.column_path("index"), "ab") as fh:
+                array("I", [day, self.count]).tofile(fh)
+        self.count += 1
+        self.last_time = timestamp
+    
+    def read(self, name, start, stop):
+        """Rows start:stop of a column as an array"""
+        code = next(code for column, code, _, _ in HISTORY_COLUMNS if column == name)
+        values = array(code)
+        if stop > start:
+            with open(self.column_path(name), "rb") as fh:
+                fh.seek(start * values.itemsize)
+                values.fromfile(fh, stop - start)
+        return values
+    
+    def rows_between(self, start, end):
+        """Row range of the samples with start <= time < end"""
+        first = bisect_left(self.days, start // 86400)
+        last = bisect_left(self.days, end // 86400 + 1)
+        lo = self.starts[first] if first < len(self.days) else self.count
+        hi = self.starts[last] if last < len(self.days) else self.count
+        # Trim the partial days at both ends
+        times = self.read("time", lo, hi)
+        return lo + bisect_left(times, start), lo + bisect_left(times, end)
+    
+    def compact(self, cutoff):
+        """Drop samples older than cutoff (a timestamp)"""
+        keep_from, _ = self.rows_between(cutoff, self.last_time + 1)
+        if keep_from == 0:
+            return
+        for name, code, _, _ in HISTORY_COLUMNS:
+            tail = self.read(name, keep_from, self.count)
+            temp_path = self.column_path(name) + ".tmp"
+            with open(temp_path, "wb") as fh:
+                tail.tofile(fh)
+            os.replace(temp_path, self.column_path(name))
+        self.count -= keep_from
+        self._rebuild_index()
+
+
+class ObservationHistory:
+    """Per-city time series of fetched observations, for trend charts.
+    
+    Each city is a directory of column files (see CitySeries), so a sample
+    costs 16 bytes on disk and a query reads only the columns and rows
+    it needs. Daily downsampling uses numpy when it is installed and plain
+    array slices otherwise.
+    """
+    
+    def __init__(self, path=HISTORY_DIR, interval=HISTORY_INTERVAL, retention_days=HISTORY_RETENTION_DAYS,
+                 max_open=HISTORY_MAX_OPEN):
+        self.path = path
+        self.interval = interval
+        self.retention_days = retention_days
+        self.max_open = max_open
+        self._series = OrderedDict()  # least recently used first
+        self._lock = threading.Lock()
+    
+    def series(self, city):
+        key = normalize_city(city)
+        series = self._series.get(key)
+        if series is not None:
+            self._series.move_to_end(key)
+        else:
+            slug = re.sub(r"[^a-z0-9]+", "-", fold_name(key)).strip("-") or "city"
+            digest = sha1(key.encode("utf-8")).hexdigest()[:8]
+            series = CitySeries(os.path.join(self.path, f"{slug}-{digest}"))
+            if series.count and series.last_time - series.read("time", 0, 1)[0] > self.retention_days * 86400:
+                series.compact(series.last_time - self.retention_days * 86400)
+            self._series[key] = series
+            if len(self._series) > self.max_open:
+                self._series.popitem(last=False)
+        return series
+    
+    def append(self, city, snapshot, timestamp=None):
+        """Store snapshot as city's latest sample, unless one was stored within the interval
+        or it is the same observation again. Returns whether a sample was written."""
+        timestamp = int(timestamp if timestamp is not None else time.time())
+        try:
+            with self._lock:
+                series = self.series(city)
+                if timestamp - series.last_time < self.interval:
+                    return False
+                if snapshot.observed_at and snapshot.observed_at == series.last_observed:
+                    return False
+                series.append(timestamp, snapshot._asdict())
+                series.last_observed = snapshot.observed_at
+                return True
+        except OSError as e:
+            log.warning("Unable to record history for %r: %s", city, e)
+            return False
+    
+    def query(self, city, start, end, columns=("time", "temp_c")):
+        """Samples with start <= time < end as {column: array}"""
+        with self._lock:
+            series = self.series(city)
+            lo, hi = series.rows_between(int(start), int(end))
+            return {name: series.read(name, lo, hi) for name in columns}
+    
+    def daily(self, city, column="temp_c", days=HISTORY_TREND_DAYS, now=None):
+        """Min, max and mean of column for each of the last `days` days that has samples"""
+        now = int(now if now is not None else time.time())
+        missing, scale = next((missing, scale) for name, _, missing, scale in HISTORY_COLUMNS if name == column)
+        with self._lock:
+            series = self.series(city)
+            first = bisect_left(series.days, now // 86400 - days + 1)
+            day_numbers = series.days[first:]
+            if not day_numbers:
+                return []
+            offsets = [start - series.starts[first] for start in series.starts[first:]]
+            values = series.read(column, series.starts[first], series.count)
+        
+        if HAS_NUMPY:
+            data = np.frombuffer(values, dtype=np.dtype(values.typecode)).astype(float)
+            data[data == missing] = np.nan
+            valid = ~np.isnan(data)
+            lows = np.fmin.reduceat(data, offsets)
+            highs = np.fmax.reduceat(data, offsets)
+            counts = np.add.reduceat(valid, offsets)
+            sums = np.add.reduceat(np.where(valid, data, 0.0), offsets)
+            rows = zip(lows.tolist(), highs.tolist(), sums.tolist(), counts.tolist())
+        else:
+            rows = []
+            for i, offset in enumerate(offsets):
+                chunk = values[offset:offsets[i + 1] if i + 1 < len(offsets) else len(values)]
+                if missing in chunk:
+                    chunk = [value for value in chunk if value != missing]
+                rows.append((min(chunk), max(chunk), sum(chunk), len(chunk)) if chunk else (0, 0, 0, 0))
+        
+        return [
+            DailyStat(day, low / scale, high / scale, total / count / scale)
+            for day, (low, high, total, count) in zip(day_numbers, rows) if count
+        ]
+    
+    def open_series(self):
+        """Cities whose index is held in memory (at most max_open)"""
+        return len(self._series)
+    
+    def stats(self):
+        """Totals for the history directory; walks it, so not for use on every tick"""
+        samples = 0
+        size = 0
+        for root, _, files in os.walk(self.path):
+            for name in files:
+                size += os.path.getsize(os.path.join(root, name))
+                if name == "time":
+                    samples += os.path.getsize(os.path.join(root, name)) // 4
+        return {"samples": samples, "bytes": size, "open": self.open_series()}
+
+
+class KioskRotation:
+    """Shows each of cities in turn for interval seconds (--kiosk), within fixed resource caps.
+    
+    The response cache is capped to KIOSK_MAX_CACHE_BYTES up front. Threads,
+    widgets and Tcl commands are checked before every switch: while any is
+    over its cap the rotation holds on the current city rather than starting
+    more work, and logs what is over. A resource report is logged every
+    report_every seconds.
+    """
+    
+    CAPS = {"threads": KIOSK_MAX_THREADS, "widgets": KIOSK_MAX_WIDGETS, "commands": KIOSK_MAX_TK_COMMANDS}
+    
+    def __init__(self, app, cities, interval=KIOSK_INTERVAL, report_every=KIOSK_REPORT_SECONDS):
+        self.app = app
+        self.cities = list(cities)
+        self.interval = interval
+        self.report_every = report_every
+        self.index = 0
+        self.shown = 0
+        self.held = 0
+        self._after_id = None
+        self._reported_at = time.monotonic()
+        # The cache evicts down to its caps on the next store
+        app.cache.max_bytes = min(app.cache.max_bytes, KIOSK_MAX_CACHE_BYTES)
+    
+    def start(self):
+        """Rotate from the city after the one on screen (the app starts on cities[0])"""
+        self.index = 1
+        self._after_id = self.app.root.after(int(self.interval * 1000), self.tick)
+    
+    def stop(self):
+        if self._after_id is not None:
+            self.app.root.after_cancel(self._after_id)
+            self._after_id = None
+    
+    def tick(self):
+        self._after_id = self.app.root.after(int(self.interval * 1000), self.tick)
+        self.advance()
+        if time.monotonic() - self._reported_at >= self.report_every:
+            self._reported_at = time.monotonic()
+            log.info("Kiosk resources: %s", json.dumps(self.report()))
+    
+    def advance(self):
+        """Show the next city unless a cap is exceeded; returns the city, or None when holding"""
+        over = self.over_caps(self.app.resource_usage())
+        if over:
+            # Give finished threads and unreachable widgets a chance to go before holding
+            gc.collect()
+            over = self.over_caps(self.app.resource_usage())
+        if over:
+            self.held += 1
+            log.warning("Kiosk: holding on the current city, over caps: %s", ", ".join(over))
+            return None
+        city = self.cities[self.index % len(self.cities)]
+        self.index += 1
+        self.shown += 1
+        self.app.search_favorite(city)
+        return city
+    
+    def over_caps(self, usage):
+        return [f"{name} {usage[name]}/{cap}" for name, cap in self.CAPS.items() if usage[name] > cap]
+    
+    def report(self):
+        return {**self.app.resource_usage(), "shown": self.shown, "held": self.held}
+
+
+class Place(NamedTuple):
+    name: str
+    country: str
+    population: int
+    
+    @property
+    def label(self):
+        return f"{self.name}, {self.country}"
+
+
+class Gazetteer:
+    """Offline place-name index for autocomplete.
+    
+    Folded names and aliases are kept in one sorted list with a parallel
+    array of place ids, so a prefix lookup is two binary searches plus a
+    top-N by population over the matching range. Results for one and two
+    letter prefixes, whose ranges are the largest, are memoized.
+    """
+    
+    def __init__(self, places, names):
+        """places: list of Place; names: iterable of (folded name or alias, place id)"""
+        self.places = places
+        entries = sorted(names, key=lambda entry: (entry[0], -places[entry[1]].population))
+        self._keys = [key for key, _ in entries]
+        self._ids = array("I", (place_id for _, place_id in entries))
+        self._short = {}
+    
+    @classmethod
+    def load(cls, path=GAZETTEER_PATH):
+        """Read a tab separated file of name, country, population and comma separated aliases"""
+        places = []
+        names = []
+        with open(path, encoding="utf-8") as fh:
+            for line in fh:
+                if not line.strip() or line.startswith("#"):
+                    continue
+                fields = line.rstrip("\n").split("\t")
+                name, country, population = fields[0], sys.intern(fields[1]), int(fields[2])
+                place_id = len(places)
+                places.append(Place(name, country, population))
+                names.append((fold_name(name), place_id))
+                if len(fields) > 3 and fields[3]:
+                    for alias in fields[3].split(","):
+                        names.append((fold_name(alias), place_id))
+        return cls(places, names)
+    
+    def __len__(self):
+        return len(self.places)
+    
+    def suggest(self, text, limit=SUGGESTION_LIMIT):
+        """Places whose name or an alias starts with text, most populous first"""
+        prefix = fold_name(text)
+        if not prefix:
+            return []
+        if len(prefix) <= 2 and prefix in self._short:
+            return self._short[prefix]
+        
+        lo = bisect_left(self._keys, prefix)
+        hi = bisect_left(self._keys, prefix + "\uffff", lo)
+        place_ids = set(self._ids[lo:hi])
+        best = heapq.nlargest(limit, place_ids, key=lambda place_id: self.places[place_id].population)
+        suggestions = [self.places[place_id] for place_id in best]
+        if len(prefix) <= 2:
+            self._short[prefix] = suggestions
+        return suggestions
+    
+    def resolve(self, text):
+        """The place text names exactly (by name or alias, optionally followed by ', country'), else None"""
+        name, _, country = fold_name(text).partition(",")
+        name = name.strip()
+        country = country.strip()
+        i = bisect_left(self._keys, name)
+        while i < len(self._keys) and self._keys[i] == name:
+            place = self.places[self._ids[i]]
+            if not country or fold_name(place.country) == country:
+                return place
+            i += 1
+        return None
+
+
+class AnimationScheduler:
+    """Drives every animation from a single root.after loop.
+    
+    Animations register a callback and an interval. The scheduler never ticks
+    faster than the FPS budget, stops ticking entirely while the window is
+    unmapped or fully covered (and, for decorative animations, while the user
+    is idle), and drops frames instead of catching up when the main loop is
+    behind.
+    """
+    
+    def __init__(self, root, fps=ANIMATION_FPS, idle_timeout=IDLE_PAUSE_SECONDS):
+        self.root = root
+        self.frame_interval = 1.0 / fps
+        self.idle_timeout = idle_timeout
+        self.visible = True
+        self.frames = 0
+        self.dropped_frames = 0
+        self._animations = {}
+        self._after_id = None
+        self._next_tick = 0.0
+        self._idle = False
+        self._last_input = time.monotonic()
+        
+        root.bind("<Map>", self._on_map, add="+")
+        root.bind("<Unmap>", self._on_unmap, add="+")
+        for sequence in ("<Motion>", "<Any-KeyPress>", "<Any-Button>", "<MouseWheel>"):
+            root.bind_all(sequence, self._on_input, add="+")
+    
+    def register(self, name, callback, interval, decorative=False):
+        """Call callback() every interval seconds; decorative animations pause when idle"""
+        self._animations[name] = [callback, max(interval, self.frame_interval), 0.0, decorative]
+        self._wake()
+    
+    def unregister(self, name):
+        self._animations.pop(name, None)
+    
+    def set_visible(self, visible):
+        self.visible = visible
+        if visible:
+            self._wake()
+    
+    def stop(self):
+        self._animations.clear()
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+    
+    def _on_map(self, event):
+        if event.widget is self.root:
+            self.set_visible(True)
+    
+    def _on_unmap(self, event):
+        if event.widget is self.root:
+            self.visible = False
+    
+    def _on_input(self, event):
+        self._last_input = time.monotonic()
+        if self._idle:
+            self._idle = False
+            self._wake()
+    
+    def _wake(self):
+        if self._after_id is None and self.visible and self._animations:
+            self._next_tick = time.monotonic()
+            self._after_id = self.root.after_idle(self._tick)
+    
+    def _tick(self):
+        self._after_id = None
+        if not self.visible:
+            return
+        
+        now = time.monotonic()
+        # Main loop is behind: skip the missed frames rather than replaying them
+        late = now - self._next_tick
+        if late > self.frame_interval:
+            self.dropped_frames += int(late / self.frame_interval)
+        
+        self._idle = now - self._last_input > self.idle_timeout
+        next_due = None
+        for animation in list(self._animations.values()):
+            callback, interval, due, decorative = animation
+            if decorative and self._idle:
+                continue
+            if now >= due:
+                callback()
+                due = animation[2] = max(due + interval, now)
+            if next_due is None or due < next_due:
+                next_due = due
+        self.frames += 1
+        
+        # Nothing left to animate (or only decorative work while idle): stay asleep
+        if next_due is None:
+            return
+        delay = max(next_due - now, self.frame_interval)
+        self._next_tick = now + delay
+        self._after_id = self.root.after(int(delay * 1000), self._tick)
+
+
+class IconCache:
+    """Weather icons as PhotoImages, shared by every widget that shows one.
+    
+    A size's sprite sheet is decoded the first time an icon of that size is
+    asked for and cut into one image per icon, so memory is bounded by
+    ICON_NAMES x ICON_SIZES (about 160 KB decoded) however often the view is
+    redrawn. get() returns None when the sheet can't be loaded; callers then
+    show ICON_EMOJI instead.
+    """
+    
+    def __init__(self, master, path=ICON_DIR):
+        self.master = master
+        self.path = path
+        self._images = {}  # size -> {name: PhotoImage}
+    
+    def get(self, name, size):
+        images = self._images.get(size)
+        if images is None:
+            images = self._images[size] = self._load(size)
+        return images.get(name)
+    
+    def _load(self, size):
+        path = os.path.join(self.path, f"weather-{size}.png")
+        with tracer.span("icons.decode", size=size):
+            try:
+                sheet = tk.PhotoImage(master=self.master, file=path)
+            except tk.TclError as e:
+                log.warning("Unable to load icons from %s, using emoji: %s", path, e)
+                return {}
+            images = {}
+            for i, name in enumerate(ICON_NAMES):
+                image = tk.PhotoImage(master=self.master, width=size, height=size)
+                image.tk.call(image, "copy", sheet, "-from", i * size, 0, (i + 1) * size, size)
+                images[name] = image
+        return images
+    
+    def stats(self):
+        count = sum(len(images) for images in self._images.values())
+        size = sum(len(images) * size * size * 4 for size, images in self._images.items())
+        return {"images": count, "bytes": size}
+
+
+class HourlyChart:
+    """Hourly forecast drawn as canvas primitives: a temperature line, rain chance bars and wind.
+    
+    Positions and labels for the whole series are computed in one pass when
+    the points change. Only the columns inside the visible window get canvas
+    items, and scrolling within the same columns just moves them, so the cost
+    of a redraw depends on the chart width, not the length of the forecast.
+    """
+    
+    ICON_Y = 32
+    TEMP_TOP = 60
+    TEMP_BOTTOM = 116
+    RAIN_TOP = 130
+    RAIN_BOTTOM = 164
+    HOUR_Y = 178
+    WIND_Y = 194
+    
+    def __init__(self, parent, bg, fg, muted, line_color, bar_color, icons=None,
+                 column_width=HOURLY_COLUMN_WIDTH, height=HOURLY_CHART_HEIGHT):
+        self.frame = tk.Frame(parent, bg=bg)
+        self.canvas = tk.Canvas(self.frame, height=height, bg=bg, highlightthickness=0)
+        self.canvas.pack(fill="x")
+        self.scrollbar = ttk.Scrollbar(self.frame, orient="horizontal", command=self.xview)
+        self.scrollbar.pack(fill="x")
+        self.fg = fg
+        self.muted = muted
+        self.line_color = line_color
+        self.bar_color = bar_color
+        self.icons = icons
+        self.column_width = column_width
+        
+        self.points = ()
+        self.xs = []
+        self.temp_ys = []
+        self.rain_ys = []
+        self.labels = []
+        self.icon_images = []  # per point: a PhotoImage, or the emoji to show instead
+        self.offset = 0  # chart x shown at the left edge of the canvas
+        self.drawn = None  # (first, last, width, offset) of the items on the canvas
+        self._drag = None
+        
+        self.canvas.bind("<Configure>", lambda e: self.redraw())
+        self.canvas.bind("<Shift-MouseWheel>", self.on_wheel)
+        self.canvas.bind("<ButtonPress-1>", self.on_press)
+        self.canvas.bind("<B1-Motion>", self.on_drag)
+    
+    def set_points(self, points, days=()):
+        """points: HourlyPoints; days: the DailyForecasts they fall in, for day and night icons"""
+        if points == self.points:
+            return
+        self.points = points
+        self.offset = 0
+        self.drawn = None
+        
+        if points:
+            temps = [point.temp_c for point in points]
+            low = min(temps)
+            scale = (self.TEMP_BOTTOM - self.TEMP_TOP) / max(max(temps) - low, 1)
+            rain_scale = (self.RAIN_BOTTOM - self.RAIN_TOP) / 100
+            half = self.column_width / 2
+            self.xs = [i * self.column_width + half for i in range(len(points))]
+            self.temp_ys = [self.TEMP_BOTTOM - (temp - low) * scale for temp in temps]
+            self.rain_ys = [self.RAIN_BOTTOM - point.chance_of_rain * rain_scale for point in points]
+            self.labels = [
+                (
+                    f"{point.temp_c}°",
+                    f"{point.hour:02d}:00",
+                    f"{WIND_ARROWS_BY_OCTANT[round(point.wind_degree / 45) % 8]} {point.wind_kmph}",
+                    f"{point.chance_of_rain}%" if point.chance_of_rain else "",
+                    datetime.fromisoformat(point.date).strftime("%a") if i == 0 or point.hour == 0 else "",
+                )
+                for i, point in enumerate(points)
+            ]
+            days_by_date = {day.date: day for day in days}
+            self.icon_images = []
+            for point in points:
+                day = days_by_date.get(point.date)
+                name = weather_icon(point.weather_code, night=day is not None and is_night(point.hour * 60, day))
+                image = self.icons.get(name, ICON_SIZE_HOURLY) if self.icons is not None else None
+                self.icon_images.append(image or ICON_EMOJI[name])
+        else:
+            self.xs, self.temp_ys, self.rain_ys, self.labels, self.icon_images = [], [], [], [], []
+        self.redraw()
+    
+    def visible_range(self, width):
+        first = max(0, int(self.offset // self.column_width))
+        last = min(len(self.points), int((self.offset + width) // self.column_width) + 1)
+        return first, last
+    
+    def redraw(self):
+        canvas = self.canvas
+        width = canvas.winfo_width()
+        total = len(self.points) * self.column_width
+        self.offset = max(0, min(self.offset, total - width))
+        first, last = self.visible_range(width)
+        
+        if self.drawn is not None and self.drawn[:3] == (first, last, width):
+            # Same columns, only shifted: move the existing items
+            canvas.move("all", self.drawn[3] - self.offset, 0)
+            self.drawn = (first, last, width, self.offset)
+            self.update_scrollbar(width, total)
+            return
+        
+        canvas.delete("all")
+        self.drawn = (first, last, width, self.offset)
+        self.update_scrollbar(width, total)
+        if not self.points:
+            canvas.create_text(width / 2, self.TEMP_BOTTOM, text="Hourly forecast unavailable", fill=self.muted, font=("Helvetica", 11))
+            return
+        
+        with tracer.span("render.hourly", columns=last - first):
+            shift = -self.offset
+            half = self.column_width / 2
+            bar = self.column_width * 0.3
+            line = []
+            for i in range(first, last):
+                x = self.xs[i] + shift
+                temp_label, hour_label, wind_label, rain_label, day_label = self.labels[i]
+                if day_label:
+                    if i:
+                        canvas.create_line(x - half, 4, x - half, self.WIND_Y + 8, fill=self.muted, dash=(2, 4))
+                    canvas.create_text(x - half + 4, 10, text=day_label, anchor="w", fill=self.muted, font=("Helvetica", 9, "bold"))
+                if rain_label:
+                    canvas.create_rectangle(x - bar, self.rain_ys[i], x + bar, self.RAIN_BOTTOM, fill=self.bar_color, width=0)
+                    canvas.create_text(x, self.rain_ys[i] - 7, text=rain_label, fill=self.muted, font=("Helvetica", 8))
+                icon = self.icon_images[i]
+                if isinstance(icon, str):
+                    canvas.create_text(x, self.ICON_Y, text=icon, font=("Helvetica", 14))
+                else:
+                    canvas.create_image(x, self.ICON_Y, image=icon)
+                canvas.create_text(x, self.temp_ys[i] - 12, text=temp_label, fill=self.fg, font=("Helvetica", 10, "bold"))
+                canvas.create_text(x, self.HOUR_Y, text=hour_label, fill=self.muted, font=("Helvetica", 9))
+                canvas.create_text(x, self.WIND_Y, text=wind_label, fill=self.fg, font=("Helvetica", 9))
+                line.extend((x, self.temp_ys[i]))
+            # One polyline for the temperatures, extended a column each way so it runs off the edges
+            if first > 0:
+                line[:0] = (self.xs[first - 1] + shift, self.temp_ys[first - 1])
+            if last < len(self.points):
+                line.extend((self.xs[last] + shift, self.temp_ys[last]))
+            if len(line) >= 4:
+                canvas.create_line(*line, fill=self.line_color, width=2, smooth=True)
+    
+    def update_scrollbar(self, width, total):
+        if total <= 0 or width >= total:
+            self.scrollbar.set(0, 1)
+        else:
+            self.scrollbar.set(self.offset / total, (self.offset + width) / total)
+    
+    def scroll_to(self, offset):
+        self.offset = offset
+        self.redraw()
+    
+    def xview(self, action, amount, unit=None):
+        """Scrollbar command: ("moveto", fraction) or ("scroll", n, "units" | "pages")"""
+        if action == "moveto":
+            self.scroll_to(float(amount) * len(self.points) * self.column_width)
+        elif unit == "pages":
+            self.scroll_to(self.offset + int(amount) * self.canvas.winfo_width())
+        else:
+            self.scroll_to(self.offset + int(amount) * self.column_width)
+    
+    def on_wheel(self, event):
+        self.scroll_to(self.offset - int(event.delta / 120) * self.column_width)
+        return "break"
+    
+    def on_press(self, event):
+        self._drag = (event.x, self.offset)
+    
+    def on_drag(self, event):
+        if self._drag is not None:
+            start_x, start_offset = self._drag
+            self.scroll_to(start_offset - (event.x - start_x))
+
+
+class TrendChart:
+    """Sparkline of daily temperatures from the observation history: a low-high bar and a mean line per day"""
+    
+    HEIGHT = 90
+    TOP = 10
+    BOTTOM = 80
+    
+    def __init__(self, parent, bg, muted, line_color, bar_color, days=HISTORY_TREND_DAYS):
+        self.frame = tk.Frame(parent, bg=bg)
+        self.canvas = tk.Canvas(self.frame, height=self.HEIGHT, bg=bg, highlightthickness=0)
+        self.canvas.pack(fill="x", padx=10, pady=(10, 0))
+        self.summary = tk.Label(self.frame, text="", font=("Helvetica", 10), bg=bg, fg=muted)
+        self.summary.pack(pady=(0, 10))
+        self.muted = muted
+        self.line_color = line_color
+        self.bar_color = bar_color
+        self.days = days
+        self.stats = []
+        self.canvas.bind("<Configure>", lambda e: self.redraw())
+    
+    def set_stats(self, stats):
+        """stats: DailyStat per day with samples, oldest first"""
+        if stats == self.stats:
+            return
+        self.stats = stats
+        if len(stats) >= 2:
+            low = min(stat.low for stat in stats)
+            high = max(stat.high for stat in stats)
+            mean = sum(stat.mean for stat in stats) / len(stats)
+            self.summary.config(text=f"{len(stats)} days · {low:.0f}°C to {high:.0f}°C · average {mean:.0f}°C")
+        else:
+            self.summary.config(text="")
+        self.redraw()
+    
+    def redraw(self):
+        canvas = self.canvas
+        canvas.delete("all")
+        width = canvas.winfo_width()
+        if len(self.stats) < 2:
+            canvas.create_text(width / 2, self.HEIGHT / 2, text="Trends appear after a few days of checking this city",
+                               fill=self.muted, font=("Helvetica", 11))
+            return
+        
+        low = min(stat.low for stat in self.stats)
+        scale = (self.BOTTOM - self.TOP) / max(max(stat.high for stat in self.stats) - low, 1)
+        # One slot per day of the period, so gaps in the history show as gaps
+        last_day = self.stats[-1].day
+        step = width / self.days
+        line = []
+        for stat in self.stats:
+            x = width - (last_day - stat.day + 0.5) * step
+            canvas.create_line(x, self.BOTTOM - (stat.low - low) * scale, x, self.BOTTOM - (stat.high - low) * scale,
+                               fill=self.bar_color, width=max(1, step * 0.6))
+            line.extend((x, self.BOTTOM - (stat.mean - low) * scale))
+        canvas.create_line(*line, fill=self.line_color, width=2)
+
 
 class WeatherApp:
-    def __init__(self, root):
+    def __init__(self, root, fetch_mode=FETCH_MODE, base_url=BASE_URL, cache_path=CACHE_PATH, trace_path=None,
+                 offline=False, city=None, startup_probe=False, state_path=STATE_PATH, history_dir=HISTORY_DIR):
         self.root = root
         self.root.title("Weather Pro - Your Weather Companion")
         self.root.geometry("600x950")
@@ -21,16 +2451,86 @@ class WeatherApp:
         # Animation variables
         self.loading = False
         self.dot_count = 0
-        self.circle_angle = 0
         self.circles = []
+        self.circle_step = -1
         self.animation_running = True
         
+        # Render bookkeeping; the weather cards are built after the first frame or on first use
+        self.view = None
+        self._scrollregion_after = None
+        self._scrollregion = None
+        self.last_render_ms = 0.0
+        self.render_times = deque(maxlen=50)
+        
+        # Performance overlay and main-loop lag sampling
+        self.trace_path = trace_path
+        self.overlay = None
+        self.lag_samples = deque(maxlen=120)
+        self._lag_after = None
+        self._lag_expected = None
+        
+        # Tiered fetching: what is on screen and which forecast is still to load
+        self.fetch_mode = fetch_mode
+        self.shown_generation = None
+        self.shown_partial = False
+        self.shown_key = None
+        self.forecast_pending = None
+        
+        # Stale-while-revalidate: when the data on screen was stored, and offline mode
+        self.offline = offline
+        self.shown_stored_at = None
+        self.age_note = ""
+        self._age_after = None
+        
+        # Startup: timings, the city shown on the first frame and the fetch held back until after it
+        self.startup_probe = startup_probe
+        self.startup_times = {}
+        self.startup_fetch = None
+        self.first_frame_seen = False
+        self.state_path = state_path
+        self.last_city = None
+        
+        # City autocomplete and canonical names; the gazetteer is loaded in the background after
+        # the first frame, and searches made before it is in wait for it
+        self.gazetteer = None
+        self._gazetteer_loading = False
+        self._gazetteer_done = False
+        self._search_pending = False
+        self._suggest_after = None
+        self.suggestion_places = []
+        
+        # Set by start_kiosk
+        self.kiosk = None
+        
+        # Observations recorded for the trend chart; history_dir=None keeps none
+        self.history = ObservationHistory(history_dir) if history_dir else None
+        
+        # Cached responses, keyed by normalized city name
+        self.cache = ResponseCache(path=cache_path)
+        self.client = WeatherClient(self.cache, base_url=base_url)
+        self.scheduler = RequestScheduler()
+        self.favorites = load_favorites()
+        self.refresher = FavoritesRefresher(
+            self.root, self.cache, self.scheduler, self.fetch_weather,
+            paused=lambda: self.offline or not self.animations.visible,
+            on_refreshed=self.on_favorite_refreshed
+        )
+        
         # Remove window decorations for modern look
         self.root.overrideredirect(False)
         
+        self.animations = AnimationScheduler(self.root)
+        self.icons = IconCache(self.root)
+        self.shown_icons = {}  # label name -> icon on it, so unchanged icons aren't set again
         self.create_animated_background()
         self.create_widgets()
-        self.animate_background()
+        self.restore_city(city)
+        
+        self.root.bind("<F12>", self.toggle_overlay)
+        if trace_path:
+            tracer.enabled = True
+        if tracer.enabled:
+            self.start_lag_sampling()
         
     def create_animated_background(self):
         """Create animated background canvas"""
@@ -42,6 +2542,16 @@ class WeatherApp:
             height=950
         )
         self.bg_canvas.place(x=0, y=0, relwidth=1, relheight=1)
+        self.bg_canvas.bind("<Visibility>", self.on_visibility)
+        self.bg_canvas.bind("<Map>", self.on_map)
+        
+        # Each circle orbits 10px around its centre; the orbit is computed once
+        self.circle_offsets = [
+            (math.sin(math.radians(step * 360 / CIRCLE_STEPS)) * 10,
+             math.cos(math.radians(step * 360 / CIRCLE_STEPS)) * 10)
+            for step in range(CIRCLE_STEPS)
+        ]
+        self.animation_epoch = time.monotonic()
         
         # Create floating circles for animation
         for i in range(8):
@@ -58,19 +2568,22 @@ class WeatherApp:
                 'x': x,
                 'y': y,
                 'radius': 30,
-                'angle': i * 45
+                'phase': i * CIRCLE_STEPS // 8
             })
     
     def animate_background(self):
         """Animate background circles"""
         if not self.animation_running:
             return
-            
+        
+        # Position follows the clock, so dropped frames don't slow the orbit down
+        step = int((time.monotonic() - self.animation_epoch) / CIRCLE_STEP_SECONDS) % CIRCLE_STEPS
+        if step == self.circle_step:
+            return
+        self.circle_step = step
+        
         for circle in self.circles:
-            circle['angle'] += 0.5
-            offset_x = math.sin(math.radians(circle['angle'])) * 10
-            offset_y = math.cos(math.radians(circle['angle'])) * 10
-            
+            offset_x, offset_y = self.circle_offsets[(step + circle['phase']) % CIRCLE_STEPS]
             x = circle['x'] + offset_x
             y = circle['y'] + offset_y
             r = circle['radius']
@@ -79,8 +2592,77 @@ class WeatherApp:
                 circle['id'],
                 x - r, y - r, x + r, y + r
             )
+    
+    def on_visibility(self, event):
+        """Pause animations while the window is completely covered"""
+        self.animations.set_visible(event.state != "VisibilityFullyObscured")
+    
+    def on_map(self, event):
+        if not self.first_frame_seen:
+            self.first_frame_seen = True
+            # Idle callbacks queued now run after the pending redraws
+            self.root.after_idle(self.on_first_frame)
+    
+    def on_first_frame(self):
+        """Runs once the first frame is on screen: start the work that isn't needed to draw it"""
+        self.startup_mark("first_frame")
+        threading.Thread(target=requests.load, name="import-requests", daemon=True).start()
+        self.root.after_idle(self.ensure_weather_view)
+        self.animations.register("background", self.animate_background, CIRCLE_STEP_SECONDS, decorative=True)
+        self.ensure_gazetteer()
+        self.refresher.set_favorites(self.canonical_favorites())
+        self.refresher.start()
+        if self.startup_fetch is not None:
+            self.startup_fetch()
+            self.startup_fetch = None
+        elif self.shown_key is None:
+            # No saved city and no --city: nothing will be fetched, so there is no first data
+            self.startup_mark("first_data", none=True)
+    
+    def startup_mark(self, name, none=False):
+        """Record how long after startup the first frame / first data appeared; none=True records
+        that there will be no first data (no city to show, or it couldn't be fetched)"""
+        if name in self.startup_times:
+            return
+        elapsed = time.perf_counter() - STARTED
+        self.startup_times[name] = None if none else elapsed * 1000
+        if none:
+            log.info("Startup: no %s", name.replace("_", " "))
+        else:
+            tracer.record(f"startup.{name}", elapsed)
+            log.info("Startup: %s after %.0f ms", name.replace("_", " "), elapsed * 1000)
+        if self.startup_probe:
+            ms = None if none else round(elapsed * 1000, 1)
+            print(json.dumps({"event": name, "time": time.time(), "ms": ms}), flush=True)
+            if len(self.startup_times) == 2:
+                self.root.after_idle(self.close)
+    
+    def restore_city(self, city=None):
+        """Show city (by default the last one viewed) on the first frame from the disk cache.
+        
+        Refreshing it, or searching for it when nothing is saved, waits until
+        the window is up.
+        """
+        if city is None and self.state_path:
+            city = load_state(self.state_path).get("last_city")
+        if not city:
+            return
+        self.city_entry.delete(0, "end")
+        self.city_entry.insert(0, city)
+        self.city_entry.config(fg=self.text_color)
+        
+        entry = self.cache.get_stale(cache_key(city))
+        if entry is None and self.fetch_mode != "full":
+            entry = self.cache.get_stale(cache_key(city, lite=True))
+        if entry is None:
+            self.startup_fetch = self.search_weather
+            return
         
-        self.root.after(50, self.animate_background)
+        generation = self.scheduler.advance()
+        fresh = entry.age() < self.cache.ttl
+        self.show_snapshot(generation, city, entry.value, stored_at=None if fresh else entry.stored_at)
+        if not fresh and not self.offline and not entry.value.partial:
+            self.startup_fetch = lambda: self.revalidate(city, generation)
     
     def create_widgets(self):
         # Main container frame
@@ -106,6 +2688,21 @@ class WeatherApp:
         button_frame = tk.Frame(top_bar, bg=self.card_color)
         button_frame.pack(side="right", padx=10)
         
+        # Offline mode: serve only what is stored locally
+        self.offline_btn = tk.Button(
+            button_frame,
+            text="",
+            font=("Helvetica", 10, "bold"),
+            bg=self.card_color,
+            relief="flat",
+            bd=0,
+            cursor="hand2",
+            command=self.toggle_offline,
+            padx=8
+        )
+        self.offline_btn.pack(side="left", padx=(0, 8))
+        self.update_offline_button()
+        
         minimize_btn = tk.Button(
             button_frame,
             text="—",
@@ -179,7 +2776,12 @@ class WeatherApp:
         self.city_entry.insert(0, "Enter city name...")
         self.city_entry.bind("<FocusIn>", self.on_entry_click)
         self.city_entry.bind("<FocusOut>", self.on_focusout)
-        self.city_entry.bind("<Return>", lambda e: self.search_weather())
+        self.city_entry.bind("<Return>", self.on_entry_return)
+        self.city_entry.bind("<KeyRelease>", self.on_entry_key)
+        self.city_entry.bind("<Down>", lambda e: self.move_suggestion(1))
+        self.city_entry.bind("<Up>", lambda e: self.move_suggestion(-1))
+        self.city_entry.bind("<Escape>", lambda e: self.hide_suggestions())
+        self.entry_frame = entry_frame
         
         # Search button
         self.search_btn = tk.Button(
@@ -199,6 +2801,26 @@ class WeatherApp:
         self.search_btn.bind("<Enter>", self.on_button_hover)
         self.search_btn.bind("<Leave>", self.on_button_leave)
         
+        # Add/remove the searched city from favorites
+        self.favorite_btn = tk.Button(
+            search_inner,
+            text="☆",
+            font=("Helvetica", 18),
+            bg=self.card_color,
+            fg="#fbbf24",
+            activebackground=self.card_color,
+            relief="flat",
+            bd=0,
+            cursor="hand2",
+            command=self.toggle_favorite
+        )
+        self.favorite_btn.pack(side="right", padx=(0, 10))
+        
+        # Favorites bar, rebuilt only when the list changes
+        self.favorites_bar = tk.Frame(content_frame, bg=self.bg_color)
+        self.favorites_bar.pack(fill="x", padx=20)
+        self.build_favorites_bar()
+        
         # Loading label
         self.loading_label = tk.Label(
             content_frame,
@@ -214,22 +2836,36 @@ class WeatherApp:
         canvas_frame.pack(fill="both", expand=True, padx=20, pady=5)
         
         self.weather_canvas = tk.Canvas(canvas_frame, bg=self.bg_color, highlightthickness=0)
-        scrollbar = ttk.Scrollbar(canvas_frame, orient="vertical", command=self.weather_canvas.yview)
+        self.weather_scrollbar = ttk.Scrollbar(canvas_frame, orient="vertical", command=self.weather_canvas.yview)
         self.weather_frame = tk.Frame(self.weather_canvas, bg=self.bg_color)
         
-        self.weather_frame.bind(
-            "<Configure>",
-            lambda e: self.weather_canvas.configure(scrollregion=self.weather_canvas.bbox("all"))
-        )
+        self.weather_frame.bind("<Configure>", self.schedule_scrollregion)
         
         self.weather_canvas.create_window((0, 0), window=self.weather_frame, anchor="nw")
-        self.weather_canvas.configure(yscrollcommand=scrollbar.set)
+        self.weather_canvas.configure(yscrollcommand=self.on_weather_scroll)
         
         self.weather_canvas.pack(side="left", fill="both", expand=True)
-        scrollbar.pack(side="right", fill="y")
+        self.weather_scrollbar.pack(side="right", fill="y")
+        
+        # Bind mousewheel for scrolling, alongside the AnimationScheduler's binding that wakes idle animations
+        self.weather_canvas.bind_all("<MouseWheel>", self._on_mousewheel, add="+")
         
-        # Bind mousewheel for scrolling
-        self.weather_canvas.bind_all("<MouseWheel>", self._on_mousewheel)
+        # Autocomplete dropdown, placed over the content under the search box when there are suggestions
+        self.suggestion_list = tk.Listbox(
+            self.root,
+            font=("Helvetica", 12),
+            bg=self.card_color,
+            fg=self.text_color,
+            selectbackground=self.accent_color,
+            selectforeground="white",
+            relief="flat",
+            bd=0,
+            highlightthickness=1,
+            highlightbackground="#334155",
+            activestyle="none",
+            takefocus=0
+        )
+        self.suggestion_list.bind("<Button-1>", self.on_suggestion_click)
         
         # Quit button at bottom
         quit_btn = tk.Button(
@@ -252,6 +2888,11 @@ class WeatherApp:
         """Handle mouse wheel scrolling"""
         self.weather_canvas.yview_scroll(int(-1*(event.delta/120)), "units")
     
+    def on_weather_scroll(self, first, last):
+        self.weather_scrollbar.set(first, last)
+        if self.forecast_pending is not None:
+            self.maybe_load_forecast()
+    
     def minimize_window(self):
         """Minimize the window"""
         self.root.iconify()
@@ -259,9 +2900,118 @@ class WeatherApp:
     def quit_app(self):
         """Quit the application with confirmation"""
         if messagebox.askokcancel("Quit", "Do you want to quit Weather Pro?"):
-            self.animation_running = False
-            self.root.quit()
-            self.root.destroy()
+            self.close()
+    
+    def close(self):
+        self.animation_running = False
+        self.animations.stop()
+        self.refresher.stop()
+        if self.kiosk is not None:
+            self.kiosk.stop()
+            log.info("Kiosk resources: %s", json.dumps(self.kiosk.report()))
+        log.info("Cache stats: %s", self.cache.stats())
+        log.info("Network stats: %s", self.client.stats())
+        if self.trace_path:
+            count = tracer.export_jsonl(self.trace_path)
+            log.info("Wrote %d spans to %s", count, self.trace_path)
+        self.scheduler.shutdown()
+        self.client.close()
+        self.cache.close()
+        self.root.quit()
+        self.root.destroy()
+    
+    def toggle_overlay(self, event=None):
+        """Show or hide the debug performance overlay (F12); tracing runs while it is shown"""
+        if self.overlay is None:
+            self.overlay = tk.Label(
+                self.root,
+                text="",
+                font=("Courier", 9),
+                justify="left",
+                anchor="nw",
+                bg="#020617",
+                fg="#a3e635",
+                padx=8,
+                pady=6
+            )
+        
+        if self.overlay.winfo_manager():
+            self.overlay.place_forget()
+            self.animations.unregister("overlay")
+            tracer.enabled = bool(self.trace_path) or os.environ.get("WEATHERME_TRACE") == "1"
+        else:
+            tracer.enabled = True
+            self.start_lag_sampling()
+            self.overlay.place(relx=1.0, x=-20, y=80, anchor="ne")
+            self.overlay.lift()
+            self.animations.register("overlay", self.refresh_overlay, 0.5)
+    
+    def refresh_overlay(self):
+        lines = ["span               ms  city"]
+        for span in tracer.recent(12):
+            lines.append(f"{span['name']:<15}{span['ms']:>8.1f}  {span.get('city', '')}")
+        
+        cache = self.cache.stats()
+        lines.append("")
+        lines.append(f"cache  {cache['hits']} hit / {cache['misses']} miss / {cache['evictions']} evicted")
+        lines.append(f"       {cache['entries']} entries, {cache['bytes'] / 1024:.1f} KB")
+        scheduler = self.scheduler.stats()
+        lines.append(f"fetch  {scheduler['in_flight']} in flight, {scheduler['coalesced']} coalesced, "
+                     f"{scheduler['debounced']} debounced")
+        client = self.client.stats()
+        lines.append(f"net    {client['retries']} retries, {client['hedges']} hedged ({client['hedge_wins']} won), "
+                     f"{client['revalidated']} revalidated")
+        lines.append(f"       breaker {client['breaker']}, {client['breaker_trips']} trips, "
+                     f"{client['breaker_rejected']} rejected")
+        refresher = self.refresher.stats()
+        lines.append(f"warm   {refresher['favorites']} favorites, {refresher['refreshed']} refreshed, "
+                     f"{refresher['skipped']} skipped, {refresher['failed']} failed")
+        icons = self.icons.stats()
+        lines.append(f"icons  {icons['images']} images, {icons['bytes'] / 1024:.0f} KB")
+        lag = max(self.lag_samples, default=0.0)
+        lines.append(f"render {self.last_render_ms:.1f} ms, main-loop lag {lag:.0f} ms max")
+        self.overlay.config(text="\n".join(lines))
+    
+    def resource_usage(self):
+        """Process and Tk resources in use, for kiosk caps, its reports and benchmark.py soak"""
+        cache = self.cache.stats()
+        usage = {
+            "rss": rss_bytes(),
+            "threads": threading.active_count(),
+            **tk_counts(self.root),
+            "cache_entries": cache['entries'],
+            "cache_bytes": cache['bytes'],
+            "in_flight": self.scheduler.stats()['in_flight'],
+            "icons": self.icons.stats()['images'],
+        }
+        if self.history is not None:
+            usage["history_open"] = self.history.open_series()
+        return usage
+    
+    def start_kiosk(self, cities, interval=KIOSK_INTERVAL):
+        """Rotate through cities every interval seconds; cities[0] should be the one on screen"""
+        self.kiosk = KioskRotation(self, cities, interval)
+        self.kiosk.start()
+        log.info("Kiosk mode: %d cities, %d s each", len(self.kiosk.cities), interval)
+    
+    def start_lag_sampling(self):
+        if self._lag_after is None:
+            self._lag_expected = None
+            self.sample_lag()
+    
+    def sample_lag(self):
+        """Measure how late root.after callbacks fire while tracing is enabled"""
+        self._lag_after = None
+        if not tracer.enabled or not self.animation_running:
+            return
+        now = time.perf_counter()
+        if self._lag_expected is not None:
+            lag = max(0.0, now - self._lag_expected)
+            self.lag_samples.append(lag * 1000)
+            if lag * 1000 > LAG_SPAN_MS:
+                tracer.record("tk.lag", lag)
+        self._lag_expected = now + LAG_SAMPLE_MS / 1000
+        self._lag_after = self.root.after(LAG_SAMPLE_MS, self.sample_lag)
     
     def on_entry_click(self, event):
         if self.city_entry.get() == "Enter city name...":
@@ -269,6 +3019,7 @@ class WeatherApp:
             self.city_entry.config(fg=self.text_color)
     
     def on_focusout(self, event):
+        self.hide_suggestions()
         if self.city_entry.get() == "":
             self.city_entry.insert(0, "Enter city name...")
             self.city_entry.config(fg="#64748b")
@@ -284,7 +3035,120 @@ class WeatherApp:
             dots = "." * (self.dot_count % 4)
             self.loading_label.config(text=f"Fetching weather data{dots}")
             self.dot_count += 1
-            self.root.after(300, self.animate_loading)
+    
+    def on_entry_key(self, event):
+        if event.keysym in ("Return", "KP_Enter", "Escape", "Up", "Down", "Tab"):
+            return
+        if self._suggest_after is not None:
+            self.root.after_cancel(self._suggest_after)
+        self._suggest_after = self.root.after(SUGGEST_DEBOUNCE_MS, self.update_suggestions)
+    
+    def ensure_gazetteer(self):
+        """Load the gazetteer in the background the first time it is needed"""
+        if self.gazetteer is not None or self._gazetteer_loading:
+            return
+        self._gazetteer_loading = True
+        
+        def load():
+            try:
+                gazetteer = Gazetteer.load()
+            except (OSError, ValueError, IndexError) as e:
+                log.warning("City suggestions unavailable: %s", e)
+                gazetteer = None
+            self.root.after(0, self.on_gazetteer_loaded, gazetteer)
+        
+        threading.Thread(target=load, name="gazetteer", daemon=True).start()
+    
+    def on_gazetteer_loaded(self, gazetteer):
+        """gazetteer is None if it couldn't be loaded; names are then used as typed"""
+        self.gazetteer = gazetteer
+        self._gazetteer_done = True
+        if gazetteer is not None:
+            log.debug("Loaded %d places for autocomplete", len(gazetteer))
+            self.refresher.set_favorites(self.canonical_favorites())
+        if self._search_pending:
+            self._search_pending = False
+            self.search_weather()
+        elif gazetteer is not None:
+            self.update_suggestions()
+    
+    def update_suggestions(self):
+        self._suggest_after = None
+        if self.gazetteer is None:
+            self.ensure_gazetteer()
+            return
+        text = self.city_entry.get()
+        if text == "Enter city name..." or self.root.focus_get() is not self.city_entry:
+            self.hide_suggestions()
+            return
+        
+        places = self.gazetteer.suggest(text)
+        # Nothing to add when the only suggestion is what has been typed already
+        if not places or (len(places) == 1 and fold_name(places[0].name) == fold_name(text)):
+            self.hide_suggestions()
+            return
+        
+        self.suggestion_places = places
+        self.suggestion_list.delete(0, "end")
+        for place in places:
+            self.suggestion_list.insert("end", place.label)
+        self.suggestion_list.config(height=len(places))
+        x = self.entry_frame.winfo_rootx() - self.root.winfo_rootx()
+        y = self.entry_frame.winfo_rooty() - self.root.winfo_rooty() + self.entry_frame.winfo_height() + 2
+        self.suggestion_list.place(x=x, y=y, width=self.entry_frame.winfo_width())
+        self.suggestion_list.lift()
+    
+    def hide_suggestions(self):
+        if self._suggest_after is not None:
+            self.root.after_cancel(self._suggest_after)
+            self._suggest_after = None
+        if self.suggestion_list.winfo_manager():
+            self.suggestion_list.place_forget()
+        self.suggestion_places = []
+    
+    def move_suggestion(self, step):
+        if not self.suggestion_places:
+            return None
+        selection = self.suggestion_list.curselection()
+        index = selection[0] + step if selection else (0 if step > 0 else len(self.suggestion_places) - 1)
+        index = max(0, min(index, len(self.suggestion_places) - 1))
+        self.suggestion_list.selection_clear(0, "end")
+        self.suggestion_list.selection_set(index)
+        self.suggestion_list.see(index)
+        return "break"
+    
+    def on_suggestion_click(self, event):
+        index = self.suggestion_list.nearest(event.y)
+        if 0 <= index < len(self.suggestion_places):
+            self.pick_suggestion(self.suggestion_places[index])
+        # Keep the listbox from taking focus away from the entry
+        return "break"
+    
+    def on_entry_return(self, event):
+        selection = self.suggestion_list.curselection() if self.suggestion_places else ()
+        if selection:
+            self.pick_suggestion(self.suggestion_places[selection[0]])
+        else:
+            self.search_weather()
+    
+    def pick_suggestion(self, place):
+        # The country stays in the entry so that resolving it again finds this place, not a namesake
+        self.city_entry.delete(0, "end")
+        self.city_entry.insert(0, place.label)
+        self.city_entry.config(fg=self.text_color)
+        self.search_weather()
+    
+    def canonical_city(self, city):
+        """Map names and aliases ('NYC', 'new york city, united states') to one spelling,
+        'Name, Country', so that they share a cache entry and reach the same place"""
+        if self.gazetteer is None:
+            return city
+        place = self.gazetteer.resolve(city)
+        return place.label if place is not None else city
+    
+    def canonical_favorites(self):
+        """Favorites keyed by canonical name, for the refresher"""
+        return {self.canonical_city(city): interval for city, interval in self.favorites.items()}
     
     def search_weather(self):
         city = self.city_entry.get()
@@ -292,214 +3156,601 @@ class WeatherApp:
             messagebox.showwarning("Input Error", "Please enter a city name!")
             return
         
-        self.loading = True
-        self.dot_count = 0
-        self.animate_loading()
+        self.hide_suggestions()
+        if not self._gazetteer_done:
+            # Search once the gazetteer is in, so that favorites, kiosk cities and the restored
+            # city get the same canonical name (and cache entry) as typed searches
+            self._search_pending = True
+            self.ensure_gazetteer()
+            return
+        city = self.canonical_city(city)
         
-        for widget in self.weather_frame.winfo_children():
-            widget.destroy()
+        # Serve repeat lookups straight from the cache, no round-trip needed
+        cached = self.cache.get(cache_key(city))
+        if cached is None and self.fetch_mode != "full":
+            cached = self.cache.get(cache_key(city, lite=True))
+        if cached is not None:
+            generation = self.scheduler.advance()
+            self.stop_loading()
+            self.show_snapshot(generation, city, cached)
+            return
+        
+        # Otherwise show the last known answer right away and revalidate it in the background
+        stale = self.cache.get_stale(cache_key(city))
+        if stale is None and self.fetch_mode != "full":
+            stale = self.cache.get_stale(cache_key(city, lite=True))
+        if stale is not None or self.offline:
+            generation = self.scheduler.advance()
+            self.stop_loading()
+            if stale is None:
+                self.show_status(f"📴 Offline: no saved weather for {city.strip()}")
+                return
+            self.show_snapshot(generation, city, stale.value, stored_at=stale.stored_at)
+            if not self.offline and not stale.value.partial:
+                self.revalidate(city, generation)
+            return
+        
+        lite = self.fetch_mode != "full"
+        ticket = self.scheduler.submit(cache_key(city, lite), self.fetch_weather, city, lite)
+        if ticket is None:
+            return
+        generation, future = ticket
+        
+        if not self.loading:
+            self.loading = True
+            self.dot_count = 0
+            self.animations.register("loading", self.animate_loading, 0.3)
         
-        thread = threading.Thread(target=self.fetch_weather, args=(city,))
-        thread.daemon = True
-        thread.start()
+        future.add_done_callback(lambda f: self.root.after(0, self.on_fetch_done, generation, city, lite, f))
     
-    def fetch_weather(self, city):
-        try:
-            url = f"https://wttr.in/{city}?format=j1"
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            self.root.after(0, lambda: self.display_weather(data))
-            
-        except Exception as e:
-            self.root.after(0, lambda: self.show_error(str(e)))
-        finally:
-            self.loading = False
-            self.root.after(0, lambda: self.loading_label.config(text=""))
+    def fetch_weather(self, city, lite=False):
+        """Runs on a scheduler worker thread"""
+        snapshot = self.client.fetch(city, lite)
+        # A partial (lite) answer lacks columns; the full answer that follows it is the one recorded
+        if self.history is not None and not snapshot.partial:
+            self.history.append(city, snapshot)
+        return snapshot
+    
+    def on_fetch_done(self, generation, city, lite, future):
+        # A newer search has started since this one; its result is no longer wanted
+        if not self.scheduler.is_current(generation) or future.cancelled():
+            return
+        
+        error = future.exception()
+        if lite and isinstance(error, WeatherDataError):
+            # The upstream may not support custom formats; fall back to the j1 payload. Network and
+            # HTTP errors would fail the same way again, so they are reported below instead
+            log.info("Lite answer for %r couldn't be parsed (%s), fetching the full payload", city, error)
+            self.forecast_pending = (city, generation)
+            self.load_forecast()
+            return
+        
+        self.stop_loading()
+        if error is not None:
+            if self.shown_generation == generation:
+                # Something is already on screen; keep it rather than interrupting with a dialog
+                log.warning("Unable to refresh %r: %s", city, error)
+                if self.shown_partial:
+                    self.forecast_placeholder.config(text="📅 Forecast unavailable")
+                if self.shown_stored_at is not None:
+                    self.age_note = "couldn't refresh"
+                    self.update_age_label()
+            elif isinstance(error, CircuitOpenError):
+                self.show_status(f"⚡ {error}")
+            else:
+                self.show_error(str(error))
+            return
+        
+        # The full answer may have beaten the lite one
+        if lite and self.shown_generation == generation and not self.shown_partial:
+            return
+        self.show_snapshot(generation, city, future.result())
+    
+    def show_snapshot(self, generation, city, snapshot, stored_at=None):
+        """Display snapshot; stored_at is set when it came from an expired cache entry"""
+        self.display_weather(snapshot)
+        self.shown_generation = generation
+        self.shown_partial = snapshot.partial
+        self.shown_key = normalize_city(city)
+        self.shown_stored_at = stored_at
+        self.age_note = "offline" if self.offline else "refreshing..."
+        self.update_age_label()
+        self.update_favorite_button()
+        self.update_trend(city)
+        self.root.after_idle(self.startup_mark, "first_data")
+        if city != self.last_city and self.state_path:
+            self.last_city = city
+            save_state({"last_city": city}, self.state_path)
+        self.forecast_pending = (city, generation) if snapshot.partial else None
+        if snapshot.partial and self.offline:
+            self.forecast_pending = None
+            self.forecast_placeholder.config(text="📅 Forecast not saved for offline use")
+        elif snapshot.partial:
+            if self.fetch_mode == "lazy":
+                self.root.after_idle(self.maybe_load_forecast)
+            else:
+                self.load_forecast()
+    
+    def revalidate(self, city, generation):
+        """Fetch a fresh copy of the stale snapshot on screen; on_fetch_done replaces it"""
+        _, future = self.scheduler.submit(cache_key(city), self.fetch_weather, city, supersede=False)
+        future.add_done_callback(lambda f: self.root.after(0, self.on_fetch_done, generation, city, False, f))
+    
+    def update_age_label(self):
+        """Show how old the data on screen is while it comes from an expired cache entry"""
+        if self._age_after is not None:
+            self.root.after_cancel(self._age_after)
+            self._age_after = None
+        age_label = self.view['age']
+        if self.shown_stored_at is None:
+            age_label.pack_forget()
+            return
+        
+        age = format_age(time.time() - self.shown_stored_at)
+        age_label.config(text=f"🕒 Updated {age} · {self.age_note}")
+        if not age_label.winfo_manager():
+            age_label.pack(pady=(0, 10))
+        self._age_after = self.root.after(30000, self.update_age_label)
+    
+    def show_status(self, text):
+        """Non-modal message in the loading line"""
+        self.loading_label.config(text=text)
+    
+    def toggle_offline(self):
+        self.offline = not self.offline
+        self.update_offline_button()
+        if self.shown_stored_at is not None:
+            self.age_note = "offline" if self.offline else "refreshing..."
+            self.update_age_label()
+    
+    def update_offline_button(self):
+        if self.offline:
+            self.offline_btn.config(text="📴 Offline", fg="#fbbf24")
+        else:
+            self.offline_btn.config(text="● Online", fg="#10b981")
+    
+    def on_favorite_refreshed(self, city, snapshot):
+        """Keep the view current when the city on screen is refreshed in the background"""
+        if normalize_city(city) == self.shown_key and not self.loading:
+            self.display_weather(snapshot)
+            self.shown_partial = False
+            self.forecast_pending = None
+            self.shown_stored_at = None
+            self.update_age_label()
+            self.update_trend(city)
+    
+    def update_trend(self, city):
+        """Redraw the trend chart from city's stored daily temperatures"""
+        if self.history is None:
+            return
+        with tracer.span("history.daily"):
+            self.trend_chart.set_stats(self.history.daily(city))
+    
+    def favorite_city(self, name):
+        """The favorite spelled the way it was saved, for any spelling or alias of its city"""
+        key = normalize_city(self.canonical_city(name))
+        for city in self.favorites:
+            if normalize_city(self.canonical_city(city)) == key:
+                return city
+        return None
+    
+    def toggle_favorite(self):
+        city = self.city_entry.get().strip()
+        if city == "" or city == "Enter city name...":
+            return
+        saved = self.favorite_city(city)
+        if saved is not None:
+            del self.favorites[saved]
+        elif len(self.favorites) >= MAX_FAVORITES:
+            messagebox.showinfo("Favorites", f"You can keep up to {MAX_FAVORITES} favorites.")
+            return
+        else:
+            self.favorites[city] = REFRESH_INTERVAL
+        save_favorites(self.favorites)
+        self.refresher.set_favorites(self.canonical_favorites())
+        self.build_favorites_bar()
+        self.update_favorite_button()
+    
+    def update_favorite_button(self):
+        city = self.city_entry.get()
+        is_favorite = self.favorite_city(city) is not None
+        self.favorite_btn.config(text="★" if is_favorite else "☆")
+    
+    def build_favorites_bar(self):
+        for widget in self.favorites_bar.winfo_children():
+            widget.destroy()
+        for city in self.favorites:
+            btn = tk.Button(
+                self.favorites_bar,
+                text=city,
+                font=("Helvetica", 10),
+                bg=self.card_color,
+                fg=self.text_color,
+                activebackground="#374151",
+                relief="flat",
+                bd=0,
+                cursor="hand2",
+                padx=10,
+                pady=4,
+                command=lambda c=city: self.search_favorite(c)
+            )
+            btn.pack(side="left", padx=(0, 6), pady=(0, 5))
+    
+    def search_favorite(self, city):
+        self.city_entry.delete(0, "end")
+        self.city_entry.insert(0, city)
+        self.city_entry.config(fg=self.text_color)
+        self.search_weather()
+    
+    def maybe_load_forecast(self):
+        """Load the forecast once its placeholder has been scrolled into view"""
+        if self.forecast_pending is None or not self.forecast_placeholder.winfo_manager():
+            return
+        visible_bottom = self.weather_canvas.canvasy(self.weather_canvas.winfo_height())
+        if self.forecast_placeholder.winfo_y() < visible_bottom:
+            self.load_forecast()
+    
+    def load_forecast(self):
+        city, generation = self.forecast_pending
+        self.forecast_pending = None
+        if not self.scheduler.is_current(generation):
+            return
+        _, future = self.scheduler.submit(cache_key(city), self.fetch_weather, city, supersede=False)
+        future.add_done_callback(lambda f: self.root.after(0, self.on_fetch_done, generation, city, False, f))
+    
+    def stop_loading(self):
+        self.loading = False
+        self.animations.unregister("loading")
+        self.loading_label.config(text="")
     
     def show_error(self, error_msg):
         self.loading_label.config(text="")
+        if self.startup_probe and "first_data" not in self.startup_times:
+            # The probe would wait forever on the dialog
+            log.warning("Unable to fetch weather data: %s", error_msg)
+            self.startup_mark("first_data", none=True)
+            return
+        if self.kiosk is not None:
+            # Nobody is there to close a dialog: keep the city on screen and let the rotation move on
+            log.warning("Kiosk: unable to fetch weather data: %s", error_msg)
+            self.show_status("⚠️ Unable to fetch weather data")
+            return
         messagebox.showerror("Error", f"Unable to fetch weather data.\n{error_msg}")
     
-    def display_weather(self, data):
-        try:
-            current = data['current_condition'][0]
-            location = data['nearest_area'][0]
-            
-            self.loading_label.config(text="")
+    def ensure_weather_view(self):
+        if self.view is None:
+            self.build_weather_view()
+    
+    def build_weather_view(self):
+        """Build the weather cards once; display_weather only updates their text"""
+        self.view = {}
+        self.view_sections = []
+        self.forecast_sections = []
+        self.view_visible = False
+        
+        # Location card
+        location_card = tk.Frame(self.weather_frame, bg=self.card_color, relief="flat")
+        self.view['location'] = tk.Label(
+            location_card,
+            text="",
+            font=("Helvetica", 18, "bold"),
+            bg=self.card_color,
+            fg=self.text_color,
+            pady=15
+        )
+        self.view['location'].pack()
+        # Age of the data on screen when it came from an expired cache entry
+        self.view['age'] = tk.Label(location_card, text="", font=("Helvetica", 10), bg=self.card_color, fg="#94a3b8")
+        self.view_sections.append((location_card, {"fill": "x", "pady": 10}))
+        
+        # Temperature card
+        temp_card = tk.Frame(self.weather_frame, bg=self.accent_color, relief="flat")
+        
+        self.view['emoji'] = tk.Label(
+            temp_card,
+            text="",
+            font=("Helvetica", 60),
+            bg=self.accent_color,
+            pady=10
+        )
+        self.view['emoji'].pack()
+        
+        self.view['temp'] = tk.Label(
+            temp_card,
+            text="",
+            font=("Helvetica", 48, "bold"),
+            bg=self.accent_color,
+            fg="white"
+        )
+        self.view['temp'].pack()
+        
+        self.view['feels'] = tk.Label(
+            temp_card,
+            text="",
+            font=("Helvetica", 14),
+            bg=self.accent_color,
+            fg="white",
+            pady=5
+        )
+        self.view['feels'].pack()
+        
+        self.view['desc'] = tk.Label(
+            temp_card,
+            text="",
+            font=("Helvetica", 16),
+            bg=self.accent_color,
+            fg="white",
+            pady=10
+        )
+        self.view['desc'].pack()
+        self.view_sections.append((temp_card, {"fill": "x", "pady": 10}))
+        
+        # Wind and Humidity highlights
+        highlight_frame = tk.Frame(self.weather_frame, bg=self.bg_color)
+        
+        wind_card = tk.Frame(highlight_frame, bg="#10b981", relief="flat")
+        wind_card.pack(side="left", fill="both", expand=True, padx=(0, 5))
+        
+        tk.Label(wind_card, text="💨", font=("Helvetica", 36), bg="#10b981").pack(pady=(15, 5))
+        tk.Label(wind_card, text="Wind Speed", font=("Helvetica", 12), bg="#10b981", fg="white").pack()
+        self.view['wind_speed'] = tk.Label(wind_card, text="", font=("Helvetica", 20, "bold"), bg="#10b981", fg="white")
+        self.view['wind_speed'].pack()
+        self.view['wind_dir'] = tk.Label(wind_card, text="", font=("Helvetica", 10), bg="#10b981", fg="white")
+        self.view['wind_dir'].pack(pady=(0, 15))
+        
+        humidity_card = tk.Frame(highlight_frame, bg="#3b82f6", relief="flat")
+        humidity_card.pack(side="right", fill="both", expand=True, padx=(5, 0))
+        
+        tk.Label(humidity_card, text="💧", font=("Helvetica", 36), bg="#3b82f6").pack(pady=(15, 5))
+        tk.Label(humidity_card, text="Humidity", font=("Helvetica", 12), bg="#3b82f6", fg="white").pack()
+        self.view['humidity'] = tk.Label(humidity_card, text="", font=("Helvetica", 20, "bold"), bg="#3b82f6", fg="white")
+        self.view['humidity'].pack(pady=(0, 15))
+        self.view_sections.append((highlight_frame, {"fill": "x", "pady": 10}))
+        
+        # Details grid
+        details_frame = tk.Frame(self.weather_frame, bg=self.bg_color)
+        
+        details = [
+            ("pressure", "🔽", "Pressure"),
+            ("visibility", "👁️", "Visibility"),
+            ("cloudcover", "☁️", "Cloud Cover"),
+            ("precip", "🌧️", "Precipitation")
+        ]
+        
+        row, col = 0, 0
+        for name, emoji, label in details:
+            detail_card = tk.Frame(details_frame, bg=self.card_color, relief="flat")
+            detail_card.grid(row=row, column=col, padx=5, pady=5, sticky="nsew")
             
-            # Location card
-            location_card = tk.Frame(self.weather_frame, bg=self.card_color, relief="flat")
-            location_card.pack(fill="x", pady=10)
+            tk.Label(detail_card, text=emoji, font=("Helvetica", 24), bg=self.card_color).pack(pady=(10, 0))
+            tk.Label(detail_card, text=label, font=("Helvetica", 10), bg=self.card_color, fg="#94a3b8").pack()
+            self.view[name] = tk.Label(detail_card, text="", font=("Helvetica", 14, "bold"), bg=self.card_color, fg=self.text_color)
+            self.view[name].pack(pady=(0, 10))
             
-            location_name = tk.Label(
-                location_card,
-                text=f"📍 {location['areaName'][0]['value']}, {location['country'][0]['value']}",
-                font=("Helvetica", 18, "bold"),
+            col += 1
+            if col > 1:
+                col, row = 0, row + 1
+        
+        for i in range(2):
+            details_frame.grid_rowconfigure(i, weight=1)
+            details_frame.grid_columnconfigure(i, weight=1)
+        self.view_sections.append((details_frame, {"fill": "both", "pady": 10}))
+        
+        # Recent days from the observation history
+        if self.history is not None:
+            trend_title = tk.Label(self.weather_frame, text=f"📈 Last {HISTORY_TREND_DAYS} Days", font=("Helvetica", 18, "bold"), bg=self.bg_color, fg=self.text_color, pady=10)
+            self.view_sections.append((trend_title, {}))
+            self.trend_chart = TrendChart(
+                self.weather_frame,
                 bg=self.card_color,
-                fg=self.text_color,
-                pady=15
-            )
-            location_name.pack()
-            
-            # Temperature card
-            temp_card = tk.Frame(self.weather_frame, bg=self.accent_color, relief="flat")
-            temp_card.pack(fill="x", pady=10)
-            
-            weather_desc = current['weatherDesc'][0]['value'].lower()
-            emoji = self.get_weather_emoji(weather_desc)
-            
-            emoji_label = tk.Label(
-                temp_card,
-                text=emoji,
-                font=("Helvetica", 60),
-                bg=self.accent_color,
-                pady=10
-            )
-            emoji_label.pack()
-            
-            temp_label = tk.Label(
-                temp_card,
-                text=f"{current['temp_C']}°C",
-                font=("Helvetica", 48, "bold"),
-                bg=self.accent_color,
-                fg="white"
-            )
-            temp_label.pack()
-            
-            feels_label = tk.Label(
-                temp_card,
-                text=f"Feels like {current['FeelsLikeC']}°C",
-                font=("Helvetica", 14),
-                bg=self.accent_color,
-                fg="white",
-                pady=5
-            )
-            feels_label.pack()
-            
-            desc_label = tk.Label(
-                temp_card,
-                text=current['weatherDesc'][0]['value'],
-                font=("Helvetica", 16),
-                bg=self.accent_color,
-                fg="white",
-                pady=10
+                muted="#94a3b8",
+                line_color="#f59e0b",
+                bar_color=self.accent_color
             )
-            desc_label.pack()
-            
-            # Wind and Humidity highlights
-            highlight_frame = tk.Frame(self.weather_frame, bg=self.bg_color)
-            highlight_frame.pack(fill="x", pady=10)
-            
-            wind_card = tk.Frame(highlight_frame, bg="#10b981", relief="flat")
-            wind_card.pack(side="left", fill="both", expand=True, padx=(0, 5))
-            
-            tk.Label(wind_card, text="💨", font=("Helvetica", 36), bg="#10b981").pack(pady=(15, 5))
-            tk.Label(wind_card, text="Wind Speed", font=("Helvetica", 12), bg="#10b981", fg="white").pack()
-            tk.Label(wind_card, text=f"{current['windspeedKmph']} km/h", font=("Helvetica", 20, "bold"), bg="#10b981", fg="white").pack()
-            tk.Label(wind_card, text=f"{current['winddir16Point']} ({current['winddirDegree']}°)", font=("Helvetica", 10), bg="#10b981", fg="white").pack(pady=(0, 15))
-            
-            humidity_card = tk.Frame(highlight_frame, bg="#3b82f6", relief="flat")
-            humidity_card.pack(side="right", fill="both", expand=True, padx=(5, 0))
-            
-            tk.Label(humidity_card, text="💧", font=("Helvetica", 36), bg="#3b82f6").pack(pady=(15, 5))
-            tk.Label(humidity_card, text="Humidity", font=("Helvetica", 12), bg="#3b82f6", fg="white").pack()
-            tk.Label(humidity_card, text=f"{current['humidity']}%", font=("Helvetica", 20, "bold"), bg="#3b82f6", fg="white").pack(pady=(0, 15))
-            
-            # Details grid
-            details_frame = tk.Frame(self.weather_frame, bg=self.bg_color)
-            details_frame.pack(fill="both", pady=10)
-            
-            details = [
-                ("🔽", "Pressure", f"{current['pressure']} mb"),
-                ("👁️", "Visibility", f"{current['visibility']} km"),
-                ("☁️", "Cloud Cover", f"{current['cloudcover']}%"),
-                ("🌧️", "Precipitation", f"{current['precipMM']} mm")
-            ]
-            
-            row, col = 0, 0
-            for emoji, label, value in details:
-                detail_card = tk.Frame(details_frame, bg=self.card_color, relief="flat")
-                detail_card.grid(row=row, column=col, padx=5, pady=5, sticky="nsew")
-                
-                tk.Label(detail_card, text=emoji, font=("Helvetica", 24), bg=self.card_color).pack(pady=(10, 0))
-                tk.Label(detail_card, text=label, font=("Helvetica", 10), bg=self.card_color, fg="#94a3b8").pack()
-                tk.Label(detail_card, text=value, font=("Helvetica", 14, "bold"), bg=self.card_color, fg=self.text_color).pack(pady=(0, 10))
-                
-                col += 1
-                if col > 1:
-                    col, row = 0, row + 1
-            
-            for i in range(2):
-                details_frame.grid_rowconfigure(i, weight=1)
-                details_frame.grid_columnconfigure(i, weight=1)
-            
-            self.display_tomorrow_forecast(data)
-            
-        except KeyError as e:
-            self.show_error(f"Unable to parse weather data: {e}")
+            self.view_sections.append((self.trend_chart.frame, {"fill": "x", "pady": 10}))
+        
+        # Shown in place of the forecast while a lite answer is on screen
+        self.forecast_placeholder = tk.Label(self.weather_frame, text="", font=("Helvetica", 14), bg=self.bg_color, fg="#94a3b8", pady=20)
+        
+        # Next three days, hour by hour
+        hourly_title = tk.Label(self.weather_frame, text="⏱️ Next 72 Hours", font=("Helvetica", 18, "bold"), bg=self.bg_color, fg=self.text_color, pady=10)
+        self.forecast_sections.append((hourly_title, {}))
+        self.hourly_chart = HourlyChart(
+            self.weather_frame,
+            bg=self.card_color,
+            fg=self.text_color,
+            muted="#94a3b8",
+            line_color="#f59e0b",
+            bar_color=self.accent_color,
+            icons=self.icons
+        )
+        self.forecast_sections.append((self.hourly_chart.frame, {"fill": "x", "pady": 10}))
+        
+        # Tomorrow's forecast
+        forecast_title = tk.Label(self.weather_frame, text="📅 Tomorrow's Forecast", font=("Helvetica", 18, "bold"), bg=self.bg_color, fg=self.text_color, pady=10)
+        self.forecast_sections.append((forecast_title, {}))
+        
+        forecast_card = tk.Frame(self.weather_frame, bg="#f59e0b", relief="flat")
+        
+        self.view['fc_date'] = tk.Label(forecast_card, text="", font=("Helvetica", 14), bg="#f59e0b", fg="white", pady=10)
+        self.view['fc_date'].pack()
+        self.view['fc_emoji'] = tk.Label(forecast_card, text="", font=("Helvetica", 40), bg="#f59e0b")
+        self.view['fc_emoji'].pack()
+        self.view['fc_desc'] = tk.Label(forecast_card, text="", font=("Helvetica", 14), bg="#f59e0b", fg="white")
+        self.view['fc_desc'].pack()
+        
+        temp_frame = tk.Frame(forecast_card, bg="#f59e0b")
+        temp_frame.pack(pady=10)
+        
+        self.view['fc_max'] = tk.Label(temp_frame, text="", font=("Helvetica", 16, "bold"), bg="#f59e0b", fg="white")
+        self.view['fc_max'].pack(side="left", padx=20)
+        self.view['fc_min'] = tk.Label(temp_frame, text="", font=("Helvetica", 16, "bold"), bg="#f59e0b", fg="white")
+        self.view['fc_min'].pack(side="right", padx=20)
+        
+        details_frame = tk.Frame(forecast_card, bg="#f59e0b")
+        details_frame.pack(fill="x", padx=20, pady=10)
+        
+        sun_frame = tk.Frame(details_frame, bg="#f59e0b")
+        sun_frame.pack(fill="x", pady=5)
+        
+        self.view['fc_sunrise'] = tk.Label(sun_frame, text="", font=("Helvetica", 12), bg="#f59e0b", fg="white")
+        self.view['fc_sunrise'].pack(side="left")
+        self.view['fc_sunset'] = tk.Label(sun_frame, text="", font=("Helvetica", 12), bg="#f59e0b", fg="white")
+        self.view['fc_sunset'].pack(side="right")
+        
+        self.view['fc_rain'] = tk.Label(details_frame, text="", font=("Helvetica", 12), bg="#f59e0b", fg="white", pady=5)
+        self.view['fc_rain'].pack()
+        self.view['fc_uv'] = tk.Label(details_frame, text="", font=("Helvetica", 12), bg="#f59e0b", fg="white")
+        self.view['fc_uv'].pack(pady=(0, 10))
+        self.forecast_sections.append((forecast_card, {"fill": "x", "pady": 10}))
     
-    def display_tomorrow_forecast(self, data):
-        try:
-            tomorrow = data['weather'][1]
-            
-            tk.Label(self.weather_frame, text="📅 Tomorrow's Forecast", font=("Helvetica", 18, "bold"), bg=self.bg_color, fg=self.text_color, pady=10).pack()
-            
-            forecast_card = tk.Frame(self.weather_frame, bg="#f59e0b", relief="flat")
-            forecast_card.pack(fill="x", pady=10)
-            
-            tk.Label(forecast_card, text=tomorrow['date'], font=("Helvetica", 14), bg="#f59e0b", fg="white", pady=10).pack()
-            
-            tomorrow_desc = tomorrow['hourly'][4]['weatherDesc'][0]['value']
-            tomorrow_emoji = self.get_weather_emoji(tomorrow_desc.lower())
-            
-            tk.Label(forecast_card, text=tomorrow_emoji, font=("Helvetica", 40), bg="#f59e0b").pack()
-            tk.Label(forecast_card, text=tomorrow_desc, font=("Helvetica", 14), bg="#f59e0b", fg="white").pack()
-            
-            temp_frame = tk.Frame(forecast_card, bg="#f59e0b")
-            temp_frame.pack(pady=10)
-            
-            tk.Label(temp_frame, text=f"Max: {tomorrow['maxtempC']}°C", font=("Helvetica", 16, "bold"), bg="#f59e0b", fg="white").pack(side="left", padx=20)
-            tk.Label(temp_frame, text=f"Min: {tomorrow['mintempC']}°C", font=("Helvetica", 16, "bold"), bg="#f59e0b", fg="white").pack(side="right", padx=20)
-            
-            details_frame = tk.Frame(forecast_card, bg="#f59e0b")
-            details_frame.pack(fill="x", padx=20, pady=10)
-            
-            sunrise = tomorrow['astronomy'][0]['sunrise']
-            sunset = tomorrow['astronomy'][0]['sunset']
-            
-            sun_frame = tk.Frame(details_frame, bg="#f59e0b")
-            sun_frame.pack(fill="x", pady=5)
-            
-            tk.Label(sun_frame, text=f"🌅 Sunrise: {sunrise}", font=("Helvetica", 12), bg="#f59e0b", fg="white").pack(side="left")
-            tk.Label(sun_frame, text=f"🌇 Sunset: {sunset}", font=("Helvetica", 12), bg="#f59e0b", fg="white").pack(side="right")
-            
-            tk.Label(details_frame, text=f"🌧️ Chance of Rain: {tomorrow['hourly'][4]['chanceofrain']}%", font=("Helvetica", 12), bg="#f59e0b", fg="white", pady=5).pack()
-            tk.Label(details_frame, text=f"☀️ UV Index: {tomorrow['uvIndex']}", font=("Helvetica", 12), bg="#f59e0b", fg="white", pady=(0, 10)).pack()
-            
-        except (KeyError, IndexError) as e:
-            print(f"Error displaying forecast: {e}")
-    
-    def get_weather_emoji(self, description):
-        if "clear" in description or "sunny" in description:
-            return "☀️"
-        elif "cloud" in description:
-            return "☁️"
-        elif "rain" in description:
-            return "🌧️"
-        elif "snow" in description:
-            return "❄️"
-        elif "thunder" in description or "storm" in description:
-            return "⛈️"
-        elif "fog" in description or "mist" in description:
-            return "🌫️"
+    def schedule_scrollregion(self, event=None):
+        """Recalculate the scrollregion once at idle, however many <Configure> events a render causes"""
+        if self._scrollregion_after is None:
+            self._scrollregion_after = self.root.after_idle(self.update_scrollregion)
+    
+    def update_scrollregion(self):
+        self._scrollregion_after = None
+        bbox = self.weather_canvas.bbox("all")
+        if bbox != self._scrollregion:
+            self._scrollregion = bbox
+            self.weather_canvas.configure(scrollregion=bbox)
+    
+    def display_weather(self, snapshot):
+        self.ensure_weather_view()
+        location = f"{snapshot.area}, {snapshot.country}" if snapshot.country else snapshot.area
+        values = {
+            'location': f"📍 {location}",
+            'temp': f"{snapshot.temp_c}°C",
+            'feels': f"Feels like {snapshot.feels_like_c}°C",
+            'desc': snapshot.description,
+            'wind_speed': f"{snapshot.wind_kmph} km/h",
+            'wind_dir': f"{format_value(snapshot.wind_dir)} ({format_value(snapshot.wind_degree, '{}°')})",
+            'humidity': f"{snapshot.humidity}%",
+            'pressure': f"{snapshot.pressure} mb",
+            'visibility': format_value(snapshot.visibility, "{} km"),
+            'cloudcover': format_value(snapshot.cloudcover, "{}%"),
+            'precip': f"{snapshot.precip_mm:.1f} mm",
+        }
+        
+        started = time.perf_counter()
+        self.loading_label.config(text="")
+        for name, text in values.items():
+            self.view[name].config(text=text)
+        self.set_icon('emoji', snapshot_icon(snapshot), ICON_SIZE_CURRENT)
+        
+        if not self.view_visible:
+            for section, options in self.view_sections:
+                section.pack(**options)
+            self.view_visible = True
+        
+        with tracer.span("render.forecast"):
+            self.display_tomorrow_forecast(snapshot)
+        # Tk lays out and redraws the changed widgets at idle, before this runs
+        self.root.after_idle(self.finish_render, started, snapshot.partial)
+    
+    def finish_render(self, started, partial):
+        elapsed = time.perf_counter() - started
+        tracer.record("render", elapsed, partial=partial)
+        self.last_render_ms = elapsed * 1000
+        self.render_times.append(self.last_render_ms)
+        log.debug("Rendered weather view in %.1f ms", self.last_render_ms)
+    
+    def display_tomorrow_forecast(self, snapshot):
+        if snapshot.partial:
+            self.forecast_placeholder.config(text="📅 Loading forecast...")
+            self.forecast_placeholder.pack()
+        else:
+            self.forecast_placeholder.pack_forget()
+        
+        if len(snapshot.forecast) < 2:
+            for section, _ in self.forecast_sections:
+                section.pack_forget()
+            return
+        
+        tomorrow = snapshot.forecast[1]
+        values = {
+            'fc_date': tomorrow.date,
+            'fc_desc': tomorrow.description,
+            'fc_max': f"Max: {tomorrow.max_temp_c}°C",
+            'fc_min': f"Min: {tomorrow.min_temp_c}°C",
+            'fc_sunrise': f"🌅 Sunrise: {tomorrow.sunrise}",
+            'fc_sunset': f"🌇 Sunset: {tomorrow.sunset}",
+            'fc_rain': f"🌧️ Chance of Rain: {tomorrow.chance_of_rain}%",
+            'fc_uv': f"☀️ UV Index: {tomorrow.uv_index}",
+        }
+        
+        for name, text in values.items():
+            self.view[name].config(text=text)
+        self.set_icon('fc_emoji', weather_icon(tomorrow.weather_code, tomorrow.description), ICON_SIZE_FORECAST)
+        self.hourly_chart.set_points(snapshot.hourly, snapshot.forecast)
+        # Forecast sections are last, so re-packing them keeps their order
+        for section, options in self.forecast_sections:
+            if not section.winfo_manager():
+                section.pack(**options)
+    
+    def set_icon(self, label_name, icon, size):
+        """Show icon on a view label as a cached image, or as emoji when there are no images"""
+        if self.shown_icons.get(label_name) == icon:
+            return
+        self.shown_icons[label_name] = icon
+        image = self.icons.get(icon, size)
+        if image is not None:
+            self.view[label_name].config(image=image, text="")
         else:
-            return "🌤️"
+            self.view[label_name].config(image="", text=ICON_EMOJI[icon])
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Weather Pro - Your Weather Companion")
+    parser.add_argument("--base-url", default=BASE_URL,
+                        help="wttr.in compatible server to query (default: %(default)s, or $WEATHERME_BASE_URL)")
+    parser.add_argument("--fetch-mode", choices=("full", "tiered", "lazy"), default=FETCH_MODE)
+    parser.add_argument("--offline", action="store_true", help="start in offline mode, serving only saved weather")
+    parser.add_argument("--city", help="city to show at startup (default: the last one viewed)")
+    # Used by benchmark.py startup: print first frame / first data times as JSON and exit
+    parser.add_argument("--startup-probe", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--trace", metavar="FILE",
+                        help="record hot-path timing spans and append them to FILE as JSONL on exit")
+    parser.add_argument("--kiosk", metavar="CITY,CITY", nargs="?", const="",
+                        help="full screen, rotating through the given cities (default: the favorites)")
+    parser.add_argument("--kiosk-interval", type=float, default=KIOSK_INTERVAL, metavar="SECONDS",
+                        help="seconds each city is shown in kiosk mode (default: %(default)s)")
+    
+    parser.add_argument("--serve", metavar="[HOST:]PORT", nargs="?", const=f"{PROXY_HOST}:{PROXY_PORT}",
+                        help="run a shared caching proxy for other instances instead of the app "
+                             f"(default: {PROXY_HOST}:{PROXY_PORT})")
+    
+    batch = parser.add_argument_group("batch mode", "fetch a list of cities without opening a window")
+    batch.add_argument("--batch", metavar="FILE", help="file with one city per line ('-' for stdin)")
+    batch.add_argument("--output", metavar="FILE", help="write NDJSON results here instead of stdout")
+    batch.add_argument("--workers", type=int, default=BATCH_WORKERS, help="concurrent requests (default: %(default)s)")
+    batch.add_argument("--rate", type=float, default=BATCH_RATE,
+                       help="maximum requests per second, 0 for no limit (default: %(default)s)")
+    batch.add_argument("--retries", type=int, default=FETCH_RETRIES,
+                       help="retries per city after a network error or 5xx (default: %(default)s)")
+    batch.add_argument("--lite", action="store_true", help="fetch current conditions only")
+    return parser.parse_args(argv)
+
 
 def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    if args.batch:
+        sys.exit(run_batch(args))
+    if args.serve:
+        sys.exit(run_proxy(args))
+    kiosk_cities = None
+    if args.kiosk is not None:
+        kiosk_cities = [city.strip() for city in args.kiosk.split(",") if city.strip()] or list(load_favorites())
+        if not kiosk_cities:
+            sys.exit("--kiosk needs a list of cities or some saved favorites")
     root = tk.Tk()
-    app = WeatherApp(root)
+    app = WeatherApp(root, fetch_mode=args.fetch_mode, base_url=args.base_url, trace_path=args.trace,
+                     offline=args.offline, city=kiosk_cities[0] if kiosk_cities else args.city,
+                     startup_probe=args.startup_probe)
+    if kiosk_cities:
+        root.attributes("-fullscreen", True)
+        app.start_kiosk(kiosk_cities, args.kiosk_interval)
     root.mainloop()
 
 if __name__ == "__main__":
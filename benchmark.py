@@ -0,0 +1,550 @@
+"""Benchmarks for Weather Pro, run against the recorded j1 payloads in fixtures/.
+
+Usage:
+    python benchmark.py parse [--repeat N]
+    python benchmark.py serve [--port 8000] [--latency S] [--jitter S] [--error-rate P]
+    python benchmark.py replay [--searches N] [--mode tiered] [--latency S] ...
+    python benchmark.py startup [--runs N] [--latency S]
+    python benchmark.py soak [--searches N] [--report-every N] [--max-rss-growth MB]
+    python benchmark.py breaker
+
+"serve" runs a local wttr.in stand-in on its own, "replay" starts one and drives
+the app through search_weather -> fetch_weather -> display_weather, "startup"
+launches the app repeatedly and reports import time, time to first frame and
+time to first data, and "soak" drives a kiosk rotation through tens of thousands
+of searches and checks that memory, Tk objects and threads stay flat. The
+replay, startup and soak benchmarks need a display; on a headless machine run
+them under xvfb-run. "breaker" is a fault-injection check of the client's
+circuit breaker and exits 1 if it gets stuck.
+"""
+import argparse
+import collections
+import gc
+import glob
+import gzip
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tkinter as tk
+import tracemalloc
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote
+
+import Weatherme
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(HERE, "fixtures")
+
+
+def load_fixtures():
+    """Return {city: raw j1 body} for every recorded fixture"""
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(FIXTURE_DIR, "*.j1.json"))):
+        city = os.path.basename(path)[:-len(".j1.json")].replace("-", " ")
+        with open(path, "rb") as fh:
+            fixtures[city] = fh.read()
+    return fixtures
+
+
+def fixture_for(fixtures, city):
+    """The recorded payload for city, or a stable stand-in for cities that weren't recorded"""
+    # The app asks for canonical names, "London, United Kingdom"; fixtures are named by city alone
+    key = Weatherme.normalize_city(city.partition(",")[0])
+    if key in fixtures:
+        return fixtures[key]
+    names = sorted(fixtures)
+    return fixtures[names[zlib.crc32(key.encode()) % len(names)]]
+
+
+def render_lite(data):
+    """Render a decoded j1 payload the way wttr.in answers Weatherme.LITE_FORMAT"""
+    current = data['current_condition'][0]
+    area = data['nearest_area'][0]
+    arrows = {degree: arrow for arrow, (_, degree) in Weatherme.WIND_ARROWS.items()}
+    arrow = arrows[round(int(current['winddirDegree']) / 45) % 8 * 45]
+    return "|".join((
+        f"{area['areaName'][0]['value']}, {area['country'][0]['value']}",
+        f"{int(current['temp_C']):+d}°C",
+        f"{int(current['FeelsLikeC']):+d}°C",
+        current['weatherDesc'][0]['value'],
+        f"{arrow}{current['windspeedKmph']}km/h",
+        f"{current['humidity']}%",
+        f"{current['pressure']}hPa",
+        f"{current['precipMM']}mm",
+    ))
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        path, _, query = self.path.partition("?")
+        city = unquote(path.strip("/"))
+        fmt = parse_qs(query, keep_blank_values=True).get("format", ["j1"])[0]
+
+        delay = server.latency + server.rng.uniform(-server.jitter, server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+        if not city or server.rng.random() < server.error_rate:
+            self.reply(503, b"Service unavailable", "text/plain")
+            return
+
+        body = fixture_for(server.fixtures, city)
+        if fmt == "j1":
+            self.reply(200, body, "application/json")
+        else:
+            self.reply(200, render_lite(json.loads(body)).encode(), "text/plain; charset=utf-8")
+
+    def reply(self, status, body, content_type):
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.bytes_sent += len(body)
+        if self.server.corrupt:
+            # Claims gzip but isn't: the client fails while decoding, not with a network error or 5xx
+            body = b"not gzip" * 8
+            self.send_response(status)
+            self.send_header("Content-Encoding", "gzip")
+        elif "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, compresslevel=5)
+            self.send_response(status)
+            self.send_header("Content-Encoding", "gzip")
+        else:
+            self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """Local wttr.in stand-in that replays recorded fixtures with configurable latency, jitter and errors"""
+    daemon_threads = True
+
+    def __init__(self, fixtures, port=0, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        super().__init__(("127.0.0.1", port), ReplayHandler)
+        self.fixtures = fixtures
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.corrupt = False
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="replay-server", daemon=True).start()
+        return self
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """Format p50/p95/p99 of samples given in seconds"""
+    return "  ".join(
+        f"p{pct}={percentile(samples, pct) * 1000:7.3f} ms" for pct in (50, 95, 99)
+    )
+
+
+def time_calls(fn, arg, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(arg)
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def retained_bytes(build, copies=50):
+    """Average number of bytes kept alive by each result of build()"""
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    kept = [build() for _ in range(copies)]
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del kept
+    return retained / copies
+
+
+def bench_parse(args):
+    fixtures = load_fixtures()
+    if not fixtures:
+        raise SystemExit(f"No fixtures found in {FIXTURE_DIR}")
+
+    backend = "orjson" if Weatherme.json_loads is not json.loads else "json"
+    print(f"Parsing {len(fixtures)} fixtures x {args.repeat} (JSON backend: {backend})")
+    for city, body in fixtures.items():
+        print(f"\n{city} ({len(body) / 1024:.1f} KB)")
+        print(f"  json.loads        {summarize(time_calls(json.loads, body, args.repeat))}")
+        print(f"  parse_j1          {summarize(time_calls(Weatherme.parse_j1, body, args.repeat))}")
+
+        raw = retained_bytes(lambda: json.loads(body))
+        compact = retained_bytes(lambda: Weatherme.parse_j1(body))
+        print(f"  retained per city: raw dict {raw / 1024:.1f} KB, snapshot {compact / 1024:.1f} KB")
+
+
+def bench_serve(args):
+    server = ReplayServer(load_fixtures(), args.port, args.latency, args.jitter, args.error_rate, args.seed)
+    print(f"Replaying fixtures on {server.base_url} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def pump_until(root, predicate, timeout):
+    """Run the Tk event loop until predicate() is true"""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError("search did not complete")
+        root.update()
+        time.sleep(0.0005)
+
+
+class SearchDriver:
+    """Drives a withdrawn WeatherApp through searches and records when each one has finished"""
+
+    def __init__(self, base_url, fetch_mode, history_dir=None):
+        self.root = tk.Tk()
+        self.root.withdraw()
+        self.app = Weatherme.WeatherApp(self.root, fetch_mode=fetch_mode, base_url=base_url, cache_path=None,
+                                        state_path=None, history_dir=history_dir)
+        # Every search must go upstream, and repeated cities must not be debounced
+        self.app.cache.ttl = 0
+        self.app.scheduler.debounce = 0
+        self.app.show_error = self.on_error
+        self.completed = 0
+        self.errors = 0
+        on_fetch_done = self.app.on_fetch_done
+
+        def record_completion(generation, city, lite, future):
+            on_fetch_done(generation, city, lite, future)
+            if not self.app.scheduler.is_current(generation):
+                return
+            # A lite answer that can't be parsed falls back to j1, and lazy mode stops after the lite answer
+            if not lite or (fetch_mode == "lazy" and future.exception() is None):
+                self.completed += 1
+
+        self.app.on_fetch_done = record_completion
+
+    def on_error(self, message):
+        self.errors += 1
+        self.completed += 1
+
+    def search(self, city, timeout=30):
+        target = self.completed + 1
+        self.app.city_entry.delete(0, "end")
+        self.app.city_entry.insert(0, city)
+        self.app.search_weather()
+        pump_until(self.root, lambda: self.completed >= target, timeout)
+        # Layout and the "render" span run at idle, as they would before the main loop's next event
+        self.root.update_idletasks()
+
+    def wait(self, target, timeout=30):
+        """Wait for the search started outside search() (e.g. by a kiosk rotation) to finish"""
+        pump_until(self.root, lambda: self.completed >= target, timeout)
+
+    def close(self):
+        self.app.animations.stop()
+        self.app.scheduler.shutdown()
+        self.app.client.close()
+        self.root.destroy()
+
+
+def bench_replay(args):
+    fixtures = load_fixtures()
+    server = ReplayServer(fixtures, 0, args.latency, args.jitter, args.error_rate, args.seed).start()
+    driver = SearchDriver(server.base_url, args.mode)
+    cities = sorted(fixtures)
+
+    tracer = Weatherme.tracer
+    tracer.enabled = True
+    tracer.spans = collections.deque(maxlen=args.searches * 16)
+    try:
+        # Warm up the connection pool and Tk's font and layout caches
+        for city in cities:
+            driver.search(city)
+        tracer.spans.clear()
+
+        totals = []
+        for i in range(args.searches):
+            started = time.perf_counter()
+            driver.search(cities[i % len(cities)])
+            totals.append(time.perf_counter() - started)
+        spans = list(tracer.spans)
+        if args.trace:
+            tracer.export_jsonl(args.trace)
+
+        # Memory is measured in a separate pass without tracing, tracemalloc would skew the timings
+        tracer.enabled = False
+        gc.collect()
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        memory_searches = min(args.searches, 50)
+        for i in range(memory_searches):
+            driver.search(cities[i % len(cities)])
+        gc.collect()
+        per_search = (tracemalloc.get_traced_memory()[0] - baseline) / memory_searches
+        tracemalloc.stop()
+    finally:
+        driver.close()
+        server.shutdown()
+        server.server_close()
+
+    print(f"{args.searches} searches in {args.mode} mode against {server.base_url} "
+          f"(latency {args.latency * 1000:.0f} ms, jitter {args.jitter * 1000:.0f} ms, "
+          f"error rate {args.error_rate:.0%})")
+    for kind in ("lite", "j1"):
+        fetches = [span["ms"] / 1000 for span in spans if span["name"] == "fetch" and span["kind"] == kind]
+        if fetches:
+            print(f"  fetch {kind:<9}{summarize(fetches)}")
+    for name in ("http.request", "http.transfer", "json.decode", "parse", "render", "render.forecast"):
+        samples = [span["ms"] / 1000 for span in spans if span["name"] == name]
+        if samples:
+            print(f"  {name:<15}{summarize(samples)}")
+    print(f"  {'end-to-end':<15}{summarize(totals)}")
+    print(f"  errors: {driver.errors}, upstream requests: {server.requests}, "
+          f"bytes served: {server.bytes_sent / 1024:.0f} KB")
+    print(f"  memory retained per search: {per_search / 1024:.2f} KB")
+
+
+def import_times(module, runs):
+    """Seconds to import module in each of runs fresh interpreters"""
+    code = f"import time; started = time.perf_counter(); import {module}; print(time.perf_counter() - started)"
+    return [
+        float(subprocess.run([sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True, check=True).stdout)
+        for _ in range(runs)
+    ]
+
+
+def probe_startup(command, home, timeout=60):
+    """Launch the app with --startup-probe; returns {event: seconds since launch}"""
+    env = dict(os.environ, HOME=home, USERPROFILE=home)
+    started = time.time()
+    result = subprocess.run(command + ["--startup-probe"], cwd=HERE, env=env, capture_output=True, text=True,
+                            timeout=timeout)
+    events = {}
+    for line in result.stdout.splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        # "ms": null marks an event that didn't happen, e.g. no first data on a fresh profile
+        if record["ms"] is not None:
+            events[record["event"]] = record["time"] - started
+    if "first_frame" not in events:
+        raise SystemExit(f"The app exited without drawing a frame (needs a display, try xvfb-run):\n"
+                         f"{result.stderr[-2000:]}")
+    return events
+
+
+def bench_startup(args):
+    print(f"Import time in a fresh interpreter ({args.runs} runs)")
+    print(f"  import Weatherme  {summarize(import_times('Weatherme', args.runs))}")
+    print(f"  import requests   {summarize(import_times('requests', args.runs))}  (deferred until after the first frame)")
+
+    server = ReplayServer(load_fixtures(), 0, args.latency, args.jitter, args.error_rate, args.seed).start()
+    launches = {
+        "python Weatherme.py": [sys.executable, "Weatherme.py"],
+        "python -m Weatherme": [sys.executable, "-m", "Weatherme"],
+    }
+    try:
+        for label, command in launches.items():
+            command = command + ["--base-url", server.base_url]
+            samples = collections.defaultdict(list)
+            for _ in range(args.runs):
+                # A fresh home directory per run: the first launch has no cache or saved city,
+                # the second restores the city the first one showed
+                home = tempfile.mkdtemp(prefix="weatherme-startup-")
+                try:
+                    for kind, extra in (("first run", ["--city", "London"]), ("restart", [])):
+                        events = probe_startup(command + extra, home)
+                        samples[kind, "frame"].append(events["first_frame"])
+                        samples[kind, "data"].append(events.get("first_data", float("nan")))
+                finally:
+                    shutil.rmtree(home, ignore_errors=True)
+
+            print(f"\n{label} ({args.runs} runs, times from process launch)")
+            for kind in ("first run", "restart"):
+                print(f"  {kind:<10} first frame  {summarize(samples[kind, 'frame'])}")
+                print(f"  {'':<10} first data   {summarize(samples[kind, 'data'])}")
+    finally:
+        server.shutdown()
+        server.server_close()
+    print(f"\nFirst runs fetch London from {server.base_url} "
+          f"(latency {args.latency * 1000:.0f} ms); restarts show the saved snapshot on the first frame.")
+
+
+# Soak checks: how far each measurement may rise between the end of the warm-up and the end of the run
+SOAK_SLACK = {"threads": 2, "widgets": 0, "commands": 20, "after": 5, "images": 0}
+
+
+def format_usage(usage):
+    rss = f"{usage['rss'] / 2**20:.1f} MB" if usage["rss"] is not None else "n/a"
+    return (f"rss {rss}  threads {usage['threads']}  widgets {usage['widgets']}  "
+            f"commands {usage['commands']}  after {usage['after']}  images {usage['images']}  "
+            f"cache {usage['cache_entries']} / {usage['cache_bytes'] / 1024:.0f} KB")
+
+
+def bench_soak(args):
+    fixtures = load_fixtures()
+    server = ReplayServer(fixtures, 0, args.latency, args.jitter, args.error_rate, args.seed).start()
+    history_dir = tempfile.mkdtemp(prefix="weatherme-soak-")
+    driver = SearchDriver(server.base_url, args.mode, history_dir=history_dir)
+    # The recorded cities plus stand-ins, so the caches see more cities than they can hold
+    cities = sorted(fixtures) + [f"Soak City {i}" for i in range(args.cities)]
+    kiosk = Weatherme.KioskRotation(driver.app, cities, interval=0)
+    # The cache keeps its normal TTL, as in a kiosk; with more cities than it holds most searches go upstream
+    driver.app.cache.ttl = 0 if args.upstream_only else Weatherme.CACHE_TTL
+
+    samples = []
+    started = time.perf_counter()
+    print(f"Soaking {args.searches} kiosk searches over {len(cities)} cities against {server.base_url}")
+    try:
+        for i in range(1, args.searches + 1):
+            target = driver.completed + 1
+            if kiosk.advance() is None:
+                raise SystemExit(f"Kiosk held after {i} searches: {kiosk.over_caps(driver.app.resource_usage())}")
+            # Cache hits display synchronously and never reach on_fetch_done
+            if driver.app.loading:
+                driver.wait(target)
+            if i % args.report_every == 0 or i == args.searches:
+                driver.root.update()
+                gc.collect()
+                usage = driver.app.resource_usage()
+                samples.append((i, usage))
+                elapsed = time.perf_counter() - started
+                print(f"  {i:>7} searches  {elapsed:7.1f} s  {format_usage(usage)}", flush=True)
+    finally:
+        driver.close()
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(history_dir, ignore_errors=True)
+
+    # Compare the end of the run with the end of the warm-up (the first report)
+    (_, baseline), (_, final) = samples[0], samples[-1]
+    failures = []
+    if baseline["rss"] is not None and final["rss"] - baseline["rss"] > args.max_rss_growth * 2**20:
+        failures.append(f"RSS grew {(final['rss'] - baseline['rss']) / 2**20:.1f} MB "
+                        f"(limit {args.max_rss_growth} MB)")
+    for name, slack in SOAK_SLACK.items():
+        if final[name] > baseline[name] + slack:
+            failures.append(f"{name} grew from {baseline[name]} to {final[name]} (slack {slack})")
+    print(f"\n{driver.errors} errors, {server.requests} upstream requests, {kiosk.held} holds")
+    if failures:
+        print("FAILED:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+    print(f"OK: resources flat over {samples[-1][0] - samples[0][0]} searches after a {samples[0][0]}-search warm-up")
+
+
+def check_breaker(args):
+    """A half-open trial that fails without a network error or 5xx must not leave the breaker stuck"""
+    server = ReplayServer(load_fixtures()).start()
+    breaker = Weatherme.CircuitBreaker(threshold=1, reset_timeout=0.2)
+    client = Weatherme.WeatherClient(Weatherme.ResponseCache(ttl=0), base_url=server.base_url, retries=0,
+                                     hedge=False, breaker=breaker)
+    steps = (
+        ("upstream down, circuit opens", 1.0, False, Weatherme.requests.HTTPError),
+        ("trial gets a corrupt body", 0.0, True, Weatherme.requests.RequestException),
+        ("upstream back, next trial closes the circuit", 0.0, False, None),
+    )
+    failures = []
+    try:
+        for name, error_rate, corrupt, expected in steps:
+            server.error_rate = error_rate
+            server.corrupt = corrupt
+            time.sleep(breaker.reset_timeout * 1.5)
+            try:
+                client.fetch("London")
+                error = None
+            except Exception as e:
+                error = e
+            ok = isinstance(error, expected) and not isinstance(error, Weatherme.CircuitOpenError) \
+                if expected else error is None
+            print(f"  {'ok  ' if ok else 'FAIL'} {name}: breaker {breaker.state}"
+                  f"{f', {type(error).__name__}: {error}' if error else ''}")
+            if not ok:
+                failures.append(name)
+    finally:
+        client.close()
+        server.shutdown()
+        server.server_close()
+    if failures:
+        sys.exit(1)
+
+
+def add_server_options(parser):
+    parser.add_argument("--latency", type=float, default=0.0, help="added response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- random latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Weather Pro benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parse_cmd = commands.add_parser("parse", help="micro-benchmark the j1 parser")
+    parse_cmd.add_argument("--repeat", type=int, default=200)
+    parse_cmd.set_defaults(run=bench_parse)
+
+    serve_cmd = commands.add_parser("serve", help="run the local wttr.in stand-in server")
+    serve_cmd.add_argument("--port", type=int, default=8000)
+    add_server_options(serve_cmd)
+    serve_cmd.set_defaults(run=bench_serve)
+
+    replay_cmd = commands.add_parser("replay", help="drive the app headlessly against the stand-in server")
+    replay_cmd.add_argument("--searches", type=int, default=200)
+    replay_cmd.add_argument("--mode", choices=("full", "tiered", "lazy"), default=Weatherme.FETCH_MODE)
+    replay_cmd.add_argument("--trace", metavar="FILE", help="also export the recorded spans as JSONL")
+    add_server_options(replay_cmd)
+    replay_cmd.set_defaults(run=bench_replay)
+
+    startup_cmd = commands.add_parser("startup", help="measure import time, time to first frame and to first data")
+    startup_cmd.add_argument("--runs", type=int, default=5)
+    add_server_options(startup_cmd)
+    startup_cmd.set_defaults(run=bench_startup)
+
+    soak_cmd = commands.add_parser("soak", help="kiosk rotation soak test: resources must stay flat")
+    soak_cmd.add_argument("--searches", type=int, default=20000)
+    soak_cmd.add_argument("--report-every", type=int, default=1000, metavar="N",
+                          help="print a resource report every N searches; the first one is the baseline")
+    soak_cmd.add_argument("--cities", type=int, default=200, help="stand-in cities added to the recorded ones")
+    soak_cmd.add_argument("--max-rss-growth", type=float, default=16, metavar="MB")
+    soak_cmd.add_argument("--upstream-only", action="store_true", help="send every search upstream")
+    soak_cmd.add_argument("--mode", choices=("full", "tiered", "lazy"), default=Weatherme.FETCH_MODE)
+    add_server_options(soak_cmd)
+    soak_cmd.set_defaults(run=bench_soak)
+
+    breaker_cmd = commands.add_parser("breaker", help="check the circuit breaker recovers from a failed trial")
+    breaker_cmd.set_defaults(run=check_breaker)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""Draws the weather icon sprite sheets (weather-<size>.png) used by Weatherme.py.
+
+Each icon is a few shapes described as signed distance functions in a unit
+square, rasterized separately at every size so small icons stay sharp.
+Only the standard library is needed:
+
+    python icons/make_icons.py
+"""
+import math
+import os
+import struct
+import zlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SIZES = (96, 48, 24)
+# Sheet order; must match ICON_NAMES in Weatherme.py
+NAMES = (
+    "clear-day", "clear-night", "partly-cloudy-day", "partly-cloudy-night", "cloudy",
+    "fog", "drizzle", "rain", "sleet", "snow", "thunder",
+)
+
+SUN = (251, 191, 36)
+SUN_EDGE = (180, 83, 9)
+MOON = (226, 232, 240)
+MOON_EDGE = (100, 116, 139)
+CLOUD = (241, 245, 249)
+CLOUD_BACK = (148, 163, 184)
+CLOUD_DARK = (100, 116, 139)
+CLOUD_EDGE = (71, 85, 105)
+RAIN = (147, 197, 253)
+RAIN_EDGE = (30, 64, 175)
+SNOW = (255, 255, 255)
+BOLT = (250, 204, 21)
+BOLT_EDGE = (161, 98, 7)
+
+
+# Signed distance functions: negative inside, in units of the icon size
+
+def circle(cx, cy, r):
+    return lambda x, y: math.hypot(x - cx, y - cy) - r
+
+
+def segment(x1, y1, x2, y2, r):
+    dx, dy = x2 - x1, y2 - y1
+    length = dx * dx + dy * dy
+
+    def sdf(x, y):
+        t = max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / length))
+        return math.hypot(x - x1 - t * dx, y - y1 - t * dy) - r
+    return sdf
+
+
+def polygon(*points):
+    edges = list(zip(points, points[1:] + points[:1]))
+
+    def sdf(x, y):
+        distance = min(segment(x1, y1, x2, y2, 0)(x, y) for (x1, y1), (x2, y2) in edges)
+        inside = False
+        for (x1, y1), (x2, y2) in edges:
+            if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+        return -distance if inside else distance
+    return sdf
+
+
+def union(*shapes):
+    return lambda x, y: min(shape(x, y) for shape in shapes)
+
+
+def subtract(shape, cut):
+    return lambda x, y: max(shape(x, y), -cut(x, y))
+
+
+def sun(cx, cy, r):
+    rays = [
+        segment(cx + math.cos(a) * r * 1.4, cy + math.sin(a) * r * 1.4,
+                cx + math.cos(a) * r * 1.8, cy + math.sin(a) * r * 1.8, r * 0.1)
+        for a in (i * math.pi / 4 for i in range(8))
+    ]
+    return [(union(*rays), SUN, SUN_EDGE), (circle(cx, cy, r), SUN, SUN_EDGE)]
+
+
+def moon(cx, cy, r):
+    return [(subtract(circle(cx, cy, r), circle(cx + r * 0.55, cy - r * 0.35, r * 0.85)), MOON, MOON_EDGE)]
+
+
+def cloud(cx, cy, s, color=CLOUD):
+    shape = union(
+        circle(cx - 0.17 * s, cy + 0.03 * s, 0.15 * s),
+        circle(cx + 0.02 * s, cy - 0.07 * s, 0.22 * s),
+        circle(cx + 0.21 * s, cy + 0.05 * s, 0.13 * s),
+        segment(cx - 0.17 * s, cy + 0.08 * s, cx + 0.21 * s, cy + 0.08 * s, 0.1 * s),
+    )
+    return [(shape, color, CLOUD_EDGE)]
+
+
+def drops(y, length, width, color, edge, xs=(0.32, 0.5, 0.68)):
+    return [(segment(x, y, x - length * 0.35, y + length, width), color, edge) for x in xs]
+
+
+def dots(y, r, xs=(0.32, 0.5, 0.68), step=0.0):
+    return [(circle(x, y + i * step, r), SNOW, CLOUD_EDGE) for i, x in enumerate(xs)]
+
+
+ICONS = {
+    "clear-day": sun(0.5, 0.5, 0.2),
+    "clear-night": moon(0.48, 0.52, 0.3),
+    "partly-cloudy-day": sun(0.36, 0.36, 0.14) + cloud(0.55, 0.62, 0.95),
+    "partly-cloudy-night": moon(0.38, 0.36, 0.2) + cloud(0.55, 0.62, 0.95),
+    "cloudy": cloud(0.62, 0.4, 0.75, CLOUD_BACK) + cloud(0.46, 0.6, 0.95),
+    "fog": cloud(0.5, 0.38, 0.9) + [
+        (segment(x1, y, x2, y, 0.035), CLOUD, CLOUD_EDGE)
+        for x1, x2, y in ((0.2, 0.72, 0.66), (0.3, 0.82, 0.78), (0.22, 0.62, 0.9))
+    ],
+    "drizzle": cloud(0.5, 0.4, 0.95) + drops(0.68, 0.08, 0.028, RAIN, RAIN_EDGE),
+    "rain": cloud(0.5, 0.38, 0.95) + drops(0.64, 0.2, 0.035, RAIN, RAIN_EDGE),
+    "sleet": cloud(0.5, 0.38, 0.95) + drops(0.64, 0.18, 0.035, RAIN, RAIN_EDGE, xs=(0.32, 0.68))
+             + dots(0.76, 0.05, xs=(0.5,)),
+    "snow": cloud(0.5, 0.38, 0.95) + dots(0.7, 0.05, step=0.06) + dots(0.84, 0.045, xs=(0.38, 0.62)),
+    "thunder": cloud(0.5, 0.36, 0.95, CLOUD_DARK) + [
+        (polygon((0.52, 0.52), (0.38, 0.74), (0.49, 0.74), (0.42, 0.94), (0.64, 0.66), (0.52, 0.66),
+                 (0.6, 0.52)), BOLT, BOLT_EDGE),
+    ],
+}
+
+
+def render(layers, size, pixels, left, width):
+    """Paint layers into the RGBA rows of pixels at columns left..left+size"""
+    edge = 1.2 / size  # outline width: a bit over one pixel at every size
+    for shape, color, edge_color in layers:
+        for row in range(size):
+            y = (row + 0.5) / size
+            line = pixels[row]
+            for col in range(size):
+                d = shape((col + 0.5) / size, y)
+                if d * size > 2:
+                    continue
+                # Outline first, then the fill on top, each anti-aliased over one pixel
+                for distance, rgb in ((d - edge, edge_color), (d, color)):
+                    alpha = max(0.0, min(1.0, 0.5 - distance * size))
+                    if alpha:
+                        i = 4 * (left + col)
+                        old = line[i + 3] / 255
+                        out = alpha + old * (1 - alpha)
+                        for c in range(3):
+                            line[i + c] = round((rgb[c] * alpha + line[i + c] * old * (1 - alpha)) / out)
+                        line[i + 3] = round(out * 255)
+
+
+def write_png(path, width, height, pixels):
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    raw = b"".join(b"\x00" + bytes(row) for row in pixels)
+    with open(path, "wb") as fh:
+        fh.write(b"\x89PNG\r\n\x1a\n")
+        fh.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)))
+        fh.write(chunk(b"IDAT", zlib.compress(raw, 9)))
+        fh.write(chunk(b"IEND", b""))
+
+
+def main():
+    for size in SIZES:
+        width = size * len(NAMES)
+        pixels = [bytearray(4 * width) for _ in range(size)]
+        for i, name in enumerate(NAMES):
+            render(ICONS[name], size, pixels, i * size, width)
+        path = os.path.join(HERE, f"weather-{size}.png")
+        write_png(path, width, size, pixels)
+        print(f"Wrote {path}")
+
+
+if __name__ == "__main__":
+    main()